@@ -0,0 +1,373 @@
+#
+# Benchmarks Ppl outside of Keypirinha. The plugin runs against the
+# keypirinha and keypirinha_util stand-ins of this folder and contacts
+# generated by make_vcards.py, and the timed scenarios are:
+#
+#   load_cold        on_start (load_contacts_and_settings) until the contacts
+#                    are loaded, with an empty contacts cache
+#   load_cached      the same with the contacts cache written by load_cold
+#   parse_files      parsing the contacts files alone, reported as contacts
+#                    and MB per second
+#   suggest_contacts one on_suggest per keystroke of typing names, per verb
+#   suggest_actions  on_suggest of the actions of a suggested contact
+#   on_execute       executing a suggested contact (the stand-in records the
+#                    URL or clipboard text instead of acting on it)
+#   suggest_alloc    peak traced bytes of one suggest_contacts (tracemalloc)
+#   sync_changed     sync_sources copying the vCard files from a folder
+#                    standing in for a network share, with --source-latency
+#                    ms added to every chunk read from it
+#   sync_unchanged   the same when the sources did not change
+#
+# Latencies are reported as percentiles (ms), along with the peak memory of
+# the process and the memory (traced) that the plugin keeps once loaded from
+# the cache. Every size runs in a fresh process.
+#
+# Usage:
+#   $ python bench.py --contacts 100000
+#   $ python bench.py --contacts 100000 --setting lazy_contacts=yes
+#   $ python bench.py --contacts 100000 --setting "store = sqlite"
+#   $ python bench.py --sizes 10000,100000 --output vcf.json
+#   $ python bench.py --sizes 10000,100000 --format json --compare vcf.json
+#   $ python bench.py --sizes 1000,10000,100000,1000000 --output after.json
+#   $ python bench.py --sizes 1000,10000,100000 --compare before.json
+#
+import argparse
+import gc
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCH_FOLDER = os.path.dirname(os.path.abspath(__file__))
+PACKAGE_FOLDER = os.path.dirname(os.path.dirname(BENCH_FOLDER))
+sys.path[:0] = [BENCH_FOLDER, PACKAGE_FOLDER]
+
+import keypirinha as kp
+import keypirinha_util as kpu
+import make_vcards
+
+# What users type, a keystroke at a time
+KEYSTROKE_SEQUENCES = ["john doe", "mar", "ann smith", "zoë", "cohen", "o'brien", "jd", "xyz", "van der", "14"]
+VERBS = ["Call", "Cell", "Mail", "Info"]
+
+def percentiles(samples):
+    """ Returns the count, mean and percentiles, in ms, of seconds samples """
+    if not samples:
+        return {"count": 0}
+    samples = sorted(samples)
+
+    def at(fraction):
+        return samples[min(len(samples) - 1, int(fraction * len(samples)))] * 1000
+
+    return {
+        "count": len(samples),
+        "mean_ms": sum(samples) / len(samples) * 1000,
+        "p50_ms": at(0.50),
+        "p90_ms": at(0.90),
+        "p99_ms": at(0.99),
+        "max_ms": samples[-1] * 1000,
+    }
+
+def peak_rss_mb():
+    """ Returns the peak resident memory of the process in MB, None if unknown """
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        pass
+    try:
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + \
+                [(name, ctypes.c_size_t) for name in ("PeakWorkingSetSize", "WorkingSetSize",
+                    "QuotaPeakPagedPoolUsage", "QuotaPagedPoolUsage", "QuotaPeakNonPagedPoolUsage",
+                    "QuotaNonPagedPoolUsage", "PagefileUsage", "PeakPagefileUsage")]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        ctypes.windll.psapi.GetProcessMemoryInfo(ctypes.windll.kernel32.GetCurrentProcess(),
+            ctypes.byref(counters), counters.cb)
+        return counters.PeakWorkingSetSize / (1024 * 1024)
+    except Exception:
+        return None
+
+def contact_files(args):
+    """ Returns the (path, encoding) of the generated contacts, generating
+    them on first use """
+    data_dir = os.path.join(args.work_dir, f"data-{args.contacts}-{args.files}-{args.seed}" +
+        (f"-{args.format}" if args.format != "vcf" else ""))
+    done = os.path.join(data_dir, "files.json")
+    if not os.path.exists(done):
+        os.makedirs(data_dir, exist_ok=True)
+        start = time.perf_counter()
+        files = make_vcards.generate_files(os.path.join(data_dir, f"contacts.{args.format}"), args.contacts,
+            args.files, args.encodings.split(","), args.seed, args.format)
+        print(f"Generated {args.contacts} contacts in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+        with open(done, "w") as f:
+            json.dump(files, f)
+    with open(done) as f:
+        return json.load(f)
+
+def settings_text(files, args):
+    text = "[main]\n" + "".join(f"{line}\n" for line in args.setting)
+    for path, encoding in files:
+        text += make_vcards.section(path, encoding, args.format)
+    return text
+
+def start_plugin(ppl):
+    """ Starts the plugin and waits for its background load """
+    plugin = ppl.Ppl()
+    start = time.perf_counter()
+    plugin.on_start()
+    while plugin.loader:
+        time.sleep(0.001)
+    elapsed = time.perf_counter() - start
+    plugin.on_catalog()
+    return plugin, elapsed
+
+def slow_open(share, latency):
+    """ Returns an open() whose files under share wait latency seconds for
+    every read, as a remote share would """
+    class SlowFile:
+        def __init__(self, f):
+            self.f = f
+
+        def read(self, *args):
+            time.sleep(latency)
+            return self.f.read(*args)
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            self.f.close()
+
+    def open_file(path, *args, **kwargs):
+        f = open(path, *args, **kwargs)
+        return SlowFile(f) if latency and os.path.abspath(path).startswith(share) else f
+    return open_file
+
+def sync_timings(ppl, plugin, files, args):
+    """ Times syncing the files from a stand-in share, changed then not """
+    share = tempfile.mkdtemp(prefix="ppl-bench-share-")
+    try:
+        vcard_files = []
+        for path, encoding in files:
+            shutil.copy(path, share)
+            name = os.path.basename(path)
+            vcard_files.append(ppl.VcfFile(name, os.path.join(share, name), encoding=encoding))
+        ppl.open = slow_open(share, args.source_latency / 1000)
+        timings = {"sync_changed": [], "sync_unchanged": []}
+        for round in range(args.rounds):
+            for vcard_file in vcard_files:
+                mtime = time.time() - 1000 + round
+                os.utime(vcard_file.source, (mtime, mtime))
+                vcard_file.next_reload = None
+            start = time.perf_counter()
+            plugin.sync_sources(vcard_files)
+            timings["sync_changed"].append(time.perf_counter() - start)
+            for vcard_file in vcard_files:
+                vcard_file.next_reload = None
+            start = time.perf_counter()
+            plugin.sync_sources(vcard_files)
+            timings["sync_unchanged"].append(time.perf_counter() - start)
+        return timings, {vcard_file.filename: vcard_file.transfers for vcard_file in vcard_files}
+    finally:
+        del ppl.open
+        shutil.rmtree(share, ignore_errors=True)
+
+def verb_item(verb_name):
+    return kp.CatalogItem(category=kp.ItemCategory.REFERENCE, label=f"Ppl: {verb_name}", target=verb_name)
+
+def run(args):
+    """ Runs the scenarios for one size and returns the results """
+    files = contact_files(args)
+    user_dir = tempfile.mkdtemp(prefix="ppl-bench-user-")
+    try:
+        for path, _ in files:
+            shutil.copy(path, user_dir)
+        kp.set_user_config_dir(user_dir)
+        kp.Plugin.settings = kp.Settings(text=settings_text(files, args))
+        import ppl
+
+        timings = {}
+        _, elapsed = start_plugin(ppl)
+        timings["load_cold"] = [elapsed]
+        timings["load_cached"] = []
+        for _ in range(args.rounds):
+            plugin, elapsed = start_plugin(ppl)
+            timings["load_cached"].append(elapsed)
+        contacts = len(plugin.contact_set.contacts)
+
+        timings["parse_files"] = []
+        for _ in range(args.rounds):
+            start = time.perf_counter()
+            for vcard_file in plugin.vcard_files:
+                ppl.parse_vcard_range(os.path.join(user_dir, vcard_file.filename), vcard_file)
+            timings["parse_files"].append(time.perf_counter() - start)
+        size_mb = sum(os.path.getsize(path) for path, _ in files) / (1024 * 1024)
+
+        timings["suggest_contacts"] = []
+        timings["suggest_actions"] = []
+        timings["on_execute"] = []
+        for _ in range(args.rounds):
+            for verb_name in VERBS:
+                verb = verb_item(verb_name)
+                for text in KEYSTROKE_SEQUENCES:
+                    for end in range(1, len(text) + 1):
+                        start = time.perf_counter()
+                        plugin.on_suggest(text[:end], [verb])
+                        timings["suggest_contacts"].append(time.perf_counter() - start)
+                    for item in plugin.suggestions[:3]:
+                        start = time.perf_counter()
+                        plugin.on_suggest("", [verb, item])
+                        timings["suggest_actions"].append(time.perf_counter() - start)
+                        start = time.perf_counter()
+                        plugin.on_execute(item, None)
+                        timings["on_execute"].append(time.perf_counter() - start)
+        del kpu.clipboard[:], kpu.executed[:]
+
+        sync, transfers = sync_timings(ppl, plugin, files, args)
+        timings.update(sync)
+
+        # Allocations are traced apart, tracing slows everything down
+        alloc = []
+        gc.collect()
+        tracemalloc.start()
+        verb = verb_item(VERBS[0])
+        for text in KEYSTROKE_SEQUENCES:
+            for end in range(1, len(text) + 1):
+                tracemalloc.clear_traces()
+                base = tracemalloc.get_traced_memory()[0]
+                plugin.on_suggest(text[:end], [verb])
+                alloc.append(tracemalloc.get_traced_memory()[1] - base)
+        tracemalloc.stop()
+
+        # The memory kept by a plugin loaded from the cache, once loaded
+        plugin = None
+        gc.collect()
+        tracemalloc.start()
+        plugin, _ = start_plugin(ppl)
+        gc.collect()
+        loaded_mb = tracemalloc.get_traced_memory()[0] / (1024 * 1024)
+        tracemalloc.stop()
+
+        return {
+            "contacts": args.contacts,
+            "loaded": contacts,
+            "files": args.files,
+            "format": args.format,
+            "size_mb": size_mb,
+            "encodings": args.encodings,
+            "settings": args.setting,
+            "scenarios": {name: percentiles(samples) for name, samples in timings.items()},
+            "suggest_alloc": {"mean_bytes": sum(alloc) // len(alloc), "max_bytes": max(alloc)},
+            "transfers": transfers,
+            "peak_rss_mb": peak_rss_mb(),
+            "loaded_mb": loaded_mb,
+        }
+    finally:
+        shutil.rmtree(user_dir, ignore_errors=True)
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=PACKAGE_FOLDER,
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_sizes(args):
+    """ Runs every size in a fresh process, for independent peak memory """
+    results = []
+    for size in args.sizes.split(","):
+        command = [sys.executable, __file__, "--contacts", size, "--files", str(args.files),
+            "--encodings", args.encodings, "--format", args.format, "--seed", str(args.seed), "--rounds", str(args.rounds),
+            "--source-latency", str(args.source_latency),
+            "--work-dir", args.work_dir, "--json"]
+        for setting in args.setting:
+            command += ["--setting", setting]
+        print(f"Running {size} contacts", file=sys.stderr)
+        output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+        results.append(json.loads(output))
+    return results
+
+def report(results, baseline=None):
+    baseline = {(r["contacts"], r["files"]): r for r in baseline["results"]} if baseline else {}
+    for result in results:
+        base = baseline.get((result["contacts"], result["files"]))
+        rss = result["peak_rss_mb"]
+        memory = f"{rss:.0f}MB" if rss is not None else "unknown"
+        loaded = f", {result['loaded_mb']:.0f}MB once loaded" if "loaded_mb" in result else ""
+        print(f"\n{result['loaded']} contacts in {result['files']} {result.get('format', 'vcf')} file(s), "
+            f"peak memory {memory}{loaded}")
+        print(f"  {'scenario':<18}{'count':>7}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}")
+        for name, stats in result["scenarios"].items():
+            line = f"  {name:<18}{stats['count']:>7}" + "".join(
+                f"{stats[key]:>10.3f}" for key in ("p50_ms", "p90_ms", "p99_ms", "max_ms"))
+            if base and name in base["scenarios"] and base["scenarios"][name].get("p50_ms"):
+                line += f"   p50 x{stats['p50_ms'] / base['scenarios'][name]['p50_ms']:.2f}"
+            print(line)
+        parse = result["scenarios"].get("parse_files")
+        if parse and parse.get("p50_ms"):
+            line = f"  {'parse_throughput':<18}{'':>7}{result['loaded'] / parse['p50_ms'] * 1000:>10.0f} contacts/s, " \
+                f"{result['size_mb'] / parse['p50_ms'] * 1000:.1f} MB/s"
+            print(line)
+        alloc = result["suggest_alloc"]
+        line = f"  {'suggest_alloc':<18}{'':>7}{alloc['mean_bytes']:>10} bytes mean, {alloc['max_bytes']} max"
+        if base:
+            line += f"   mean x{alloc['mean_bytes'] / max(1, base['suggest_alloc']['mean_bytes']):.2f}"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Ppl with generated contacts")
+    parser.add_argument("--contacts", type=int, default=10000, help="number of contacts")
+    parser.add_argument("--sizes", help="comma separated numbers of contacts, each run in its own process")
+    parser.add_argument("--files", type=int, default=1, help="number of contacts files")
+    parser.add_argument("--encodings", default="utf-8", help="comma separated encodings cycled over the files")
+    parser.add_argument("--format", choices=["vcf", "json", "csv"], default="vcf",
+        help="contacts files format, the same contacts as vCards, NDJSON or CSV")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--rounds", type=int, default=3, help="repetitions of every scenario")
+    parser.add_argument("--source-latency", type=float, default=0, help="ms added to every read from the stand-in share")
+    parser.add_argument("--setting", action="append", default=[], help="extra [main] setting, e.g. 'lazy_contacts = yes'")
+    parser.add_argument("--work-dir", default=os.path.join(tempfile.gettempdir(), "ppl-bench"),
+        help="folder of the generated contacts, which are reused")
+    parser.add_argument("--output", help="JSON file to store the results in")
+    parser.add_argument("--compare", help="JSON results file of a previous run to compare with")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    if args.sizes:
+        results = run_sizes(args)
+    else:
+        results = [run(args)]
+    if args.json:
+        print(json.dumps(results[0]))
+        return
+
+    output = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    report(results, baseline)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(output, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+#
+# Checks Ppl outside of Keypirinha, against the stand-ins of this folder and
+# contacts generated by make_vcards.py (see bench.py): what must hold however
+# the plugin is made faster. The checks are:
+#
+#   search_latency   every query of SEARCH_QUERIES, for every verb and with
+#                    an empty query cache, suggests within MAX_SEARCH_MS at
+#                    tens of thousands of contacts, with the contacts in
+#                    memory and in SQLite
+#   query_cache      typing random queries a keystroke at a time, narrowing
+#                    the cached matches of the previous keystrokes, suggests
+#                    the same contacts as searching every keystroke afresh
+#   shared_digits    a phone query whose trailing digits end more numbers
+#                    than a trie node keeps still finds the whole numbers
+#                    and the numbers of the fields the verb targets
+#   stalled_source   copying a source whose read never returns gives up
+#                    after source_timeout, leaves the local copy as it was
+#                    and the next load copies it once the source answers
+#
+# Every check prints what it found, the script exits with an error if one of
+# them failed.
+#
+# Usage:
+#   $ python checks.py
+#   $ python checks.py --contacts 100000 --check search_latency
+#
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_FOLDER = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_FOLDER)
+
+import keypirinha as kp
+import bench
+import make_vcards
+
+# Short queries, rare ones, words of the fields of most contacts and verbs
+# whose target few contacts have
+SEARCH_QUERIES = ["j", "jo", "q", "xq", "zz", "jd", "dan", "noa com", "o'b", "xyz", "acme", "finance"]
+SEARCH_VERBS = ["Info", "Cell", "Home", "Work", "Mail"]
+# The memory store scores all the contacts having a field word, some 30ms
+# for the word of most of 50000 contacts
+MAX_SEARCH_MS = 50
+# The random queries of the query_cache check are a first name and a last
+# name or a field word, which few enough contacts match for their matches to
+# be cached and narrowed
+FIELD_WORDS = ["finance", "sales", "support", "engineer", "acme", "controller", "director", "doc", "owner", "legal"]
+QUERY_VERBS = ["Info", "Cell", "Home", "Mail"]
+
+def start_plugin(files, args, *settings):
+    """ Starts the plugin with the generated files in a new User folder and
+    the given [main] settings. Returns it and the User folder """
+    user_dir = tempfile.mkdtemp(prefix="ppl-checks-user-")
+    for path, _ in files:
+        shutil.copy(path, user_dir)
+    kp.set_user_config_dir(user_dir)
+    kp.Plugin.settings = kp.Settings(text=bench.settings_text(files, argparse.Namespace(
+        setting=list(settings), format=args.format)))
+    import ppl
+    plugin, _ = bench.start_plugin(ppl)
+    return plugin, user_dir
+
+def suggest_time(plugin, verb_name, query, rounds=3):
+    """ Returns the best time of rounds suggestions of the query, the query
+    cache emptied before each """
+    verb = bench.verb_item(verb_name)
+    best = None
+    for _ in range(rounds):
+        plugin.contact_set.query_caches.clear()
+        start = time.perf_counter()
+        plugin.on_suggest(query, [verb])
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def check_search_latency(files, args):
+    slow = []
+    for store in ("memory", "sqlite"):
+        plugin, user_dir = start_plugin(files, args, f"store = {store}")
+        try:
+            worst = 0
+            for verb_name in SEARCH_VERBS:
+                for query in SEARCH_QUERIES:
+                    elapsed = suggest_time(plugin, verb_name, query) * 1000
+                    worst = max(worst, elapsed)
+                    if elapsed > MAX_SEARCH_MS:
+                        slow.append(f"{store} {verb_name} {query!r} {elapsed:.1f}ms")
+            print(f"  slowest suggestion {worst:.1f}ms ({store})")
+        finally:
+            shutil.rmtree(user_dir, ignore_errors=True)
+    return slow
+
+def suggestions(plugin, verb_name, query):
+    plugin.on_suggest(query, [bench.verb_item(verb_name)])
+    return [item.label() for item in plugin.suggestions]
+
+def check_query_cache(files, args):
+    plugin, user_dir = start_plugin(files, args)
+    try:
+        rng = random.Random(args.seed)
+        mismatches = []
+        keystrokes = 0
+        for _ in range(100):
+            query = f"{rng.choice(make_vcards.FIRST_NAMES)} {rng.choice(make_vcards.LAST_NAMES + FIELD_WORDS)}"
+            verb_name = rng.choice(QUERY_VERBS)
+            plugin.contact_set.query_caches.clear()
+            for end in range(1, len(query) + 1):
+                narrowed = suggestions(plugin, verb_name, query[:end])
+                # Put aside the cache of this verb for a fresh search
+                caches = dict(plugin.contact_set.query_caches)
+                plugin.contact_set.query_caches.clear()
+                fresh = suggestions(plugin, verb_name, query[:end])
+                plugin.contact_set.query_caches = caches
+                keystrokes += 1
+                if narrowed != fresh:
+                    mismatches.append(f"{verb_name} {query[:end]!r}: {narrowed[:3]}... instead of {fresh[:3]}...")
+        print(f"  {keystrokes} keystrokes compared")
+        return mismatches
+    finally:
+        shutil.rmtree(user_dir, ignore_errors=True)
+
+def check_shared_digits(files, args):
+    folder = tempfile.mkdtemp(prefix="ppl-checks-phones-")
+    path = os.path.join(folder, "phones.vcf")
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(60):
+            f.write(f"BEGIN:VCARD\nVERSION:3.0\nFN:Cell {i}\nTEL;TYPE=CELL:+1 617 55{i:02d} 4446\nEND:VCARD\n")
+        f.write("BEGIN:VCARD\nVERSION:3.0\nFN:Home Only\nTEL;TYPE=HOME:4446\nEND:VCARD\n")
+        f.write("BEGIN:VCARD\nVERSION:3.0\nFN:Work Only\nTEL;TYPE=WORK:4446\nEND:VCARD\n")
+    missing = []
+    try:
+        for store in ("memory", "sqlite"):
+            plugin, user_dir = start_plugin([(path, "utf-8")], argparse.Namespace(format="vcf"), f"store = {store}")
+            try:
+                for verb_name, name in (("Home", "Home Only"), ("Work", "Work Only"), ("Info", "Home Only")):
+                    found = suggestions(plugin, verb_name, "4446")
+                    if not any(name in label for label in found):
+                        missing.append(f"{store} {verb_name} '4446' misses {name}: {found[:3]}...")
+            finally:
+                shutil.rmtree(user_dir, ignore_errors=True)
+        print("  searched 62 numbers ending with the same digits")
+        return missing
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+def stalled_open(share, release):
+    """ Returns an open() whose files under share block every read until
+    release is set, as a share which stopped answering would """
+    class StalledFile:
+        def __init__(self, f):
+            self.f = f
+
+        def read(self, *args):
+            release.wait()
+            return self.f.read(*args)
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            self.f.close()
+
+    def open_file(path, *args, **kwargs):
+        f = open(path, *args, **kwargs)
+        return StalledFile(f) if os.path.abspath(path).startswith(share) else f
+    return open_file
+
+def check_stalled_source(files, args):
+    import ppl
+    share = tempfile.mkdtemp(prefix="ppl-checks-share-")
+    user_dir = tempfile.mkdtemp(prefix="ppl-checks-user-")
+    release = threading.Event()
+    answer = None
+    try:
+        kp.set_user_config_dir(user_dir)
+        plugin = ppl.Ppl()
+        name = os.path.basename(files[0][0])
+        shutil.copy(files[0][0], share)
+        local_path = os.path.join(user_dir, name)
+        with open(local_path, "w") as f:
+            f.write("BEGIN:VCARD\nFN:Old Copy\nEND:VCARD\n")
+        vcard_file = ppl.VcfFile(name, os.path.join(share, name), source_timeout=1)
+        failures = []
+        ppl.open = stalled_open(share, release)
+        # The share answers again in the end, should the copy wait for it
+        answer = threading.Timer(vcard_file.source_timeout + 5, release.set)
+        answer.start()
+
+        start = time.perf_counter()
+        plugin.sync_sources([vcard_file])
+        elapsed = time.perf_counter() - start
+        print(f"  gave up the stalled copy after {elapsed:.2f}s")
+        if elapsed > vcard_file.source_timeout + 1:
+            failures.append(f"the stalled copy blocked the loader for {elapsed:.2f}s")
+        if vcard_file.transfers["failures"] != 1 or not vcard_file.transfers["last_error"]:
+            failures.append(f"the stalled copy was not counted as failed: {vcard_file.transfers}")
+
+        # Copying again while the first copy still waits must not wait too
+        start = time.perf_counter()
+        plugin.sync_sources([vcard_file])
+        if time.perf_counter() - start > 0.5:
+            failures.append("copying again waited for the stalled copy")
+
+        release.set()
+        vcard_file.copier.join(10)
+        if os.path.exists(local_path + ppl.VcfFile.PART_SUFFIX):
+            failures.append("the stalled copy left its part file")
+        with open(local_path) as f:
+            if "Old Copy" not in f.read():
+                failures.append("the stalled copy replaced the local copy once given up")
+
+        # The next load tries the failed copy again
+        plugin.sync_sources([vcard_file])
+        if os.path.getsize(local_path) != os.path.getsize(files[0][0]):
+            failures.append("the source was not copied once it answered again")
+        return failures
+    finally:
+        release.set()
+        if answer:
+            answer.cancel()
+        if "ppl" in sys.modules:
+            sys.modules["ppl"].__dict__.pop("open", None)
+        shutil.rmtree(share, ignore_errors=True)
+        shutil.rmtree(user_dir, ignore_errors=True)
+
+CHECKS = {
+    "search_latency": check_search_latency,
+    "query_cache": check_query_cache,
+    "shared_digits": check_shared_digits,
+    "stalled_source": check_stalled_source,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="Check Ppl with generated contacts")
+    parser.add_argument("--contacts", type=int, default=50000, help="number of contacts")
+    parser.add_argument("--files", type=int, default=1, help="number of contacts files")
+    parser.add_argument("--format", choices=["vcf", "json", "csv"], default="vcf", help="contacts files format")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--check", action="append", choices=sorted(CHECKS), help="check to run, all by default")
+    parser.add_argument("--work-dir", default=os.path.join(tempfile.gettempdir(), "ppl-bench"),
+        help="folder of the generated contacts, which are reused")
+    args = parser.parse_args()
+    args.encodings = "utf-8"
+    files = bench.contact_files(args)
+
+    failed = False
+    for name in args.check or CHECKS:
+        print(f"{name}:")
+        failures = CHECKS[name](files, args)
+        for failure in failures:
+            print(f"  FAILED {failure}")
+        failed = failed or bool(failures)
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
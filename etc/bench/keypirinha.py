@@ -0,0 +1,211 @@
+#
+# Pure-Python stand-in for the parts of the Keypirinha host API used by Ppl,
+# so that the plugin can be loaded and benchmarked outside of Keypirinha.
+# See bench.py
+#
+import configparser
+import os
+import sys
+import tempfile
+
+PACKAGE_FOLDER = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_user_config_dir = None
+
+def user_config_dir():
+    global _user_config_dir
+    if _user_config_dir is None:
+        _user_config_dir = tempfile.mkdtemp(prefix="ppl-bench-")
+    return _user_config_dir
+
+def set_user_config_dir(path):
+    """ Stand-in only: sets the User folder the plugin reads and writes """
+    global _user_config_dir
+    _user_config_dir = path
+
+class ItemCategory:
+    KEYWORD = 1
+    FILE = 2
+    CMDLINE = 3
+    URL = 4
+    REFERENCE = 5
+    EXPRESSION = 6
+    USER_BASE = 1000
+
+class ItemArgsHint:
+    FORBIDDEN = 0
+    ACCEPTED = 1
+    REQUIRED = 2
+
+class ItemHitHint:
+    IGNORE = 0
+    NOARGS = 1
+    KEEPALL = 2
+
+class Match:
+    ANY = 0
+    FUZZY = 1
+    DEFAULT = 2
+
+class Sort:
+    NONE = 0
+    SCORE_DESC = 1
+    DEFAULT = 2
+
+class Events:
+    APPACTIVATED = 0x1
+    PACKCONFIG = 0x2
+    APPCONFIG = 0x4
+    NETOPTIONS = 0x8
+    DESKTOP = 0x10
+
+class CatalogItem:
+    def __init__(self, category, label, short_desc="", target="", args_hint=ItemArgsHint.FORBIDDEN,
+                 hit_hint=ItemHitHint.IGNORE, loop_on_suggest=False, data_bag=None, **_):
+        self._category = category
+        self._label = label
+        self._short_desc = short_desc
+        self._target = target
+        self._args_hint = args_hint
+        self._hit_hint = hit_hint
+        self._loop_on_suggest = loop_on_suggest
+        self._data_bag = data_bag
+
+    def category(self):
+        return self._category
+
+    def label(self):
+        return self._label
+
+    def short_desc(self):
+        return self._short_desc
+
+    def target(self):
+        return self._target
+
+    def args_hint(self):
+        return self._args_hint
+
+    def hit_hint(self):
+        return self._hit_hint
+
+    def loop_on_suggest(self):
+        return self._loop_on_suggest
+
+    def data_bag(self):
+        return self._data_bag
+
+    def __repr__(self):
+        return f"CatalogItem({self._label!r})"
+
+class Settings:
+    """The configuration of a package, read from ini files with the
+    Keypirinha value conventions"""
+
+    TRUE_VALUES = ("1", "y", "yes", "t", "true", "on")
+
+    def __init__(self, *paths, text=None):
+        self.config = configparser.ConfigParser(interpolation=None)
+        self.config.optionxform = str
+        self.config.read(paths, encoding="utf-8")
+        if text:
+            self.config.read_string(text)
+
+    def sections(self):
+        return self.config.sections()
+
+    def get(self, key, section="main", fallback=None, unquote=True):
+        value = self.config.get(section, key, fallback=None)
+        if value is None:
+            return fallback
+        if unquote and len(value) > 1 and value[0] == value[-1] and value[0] in "'\"":
+            value = value[1:-1]
+        return value
+
+    def get_stripped(self, key, section="main", fallback=None, unquote=True):
+        value = self.get(key, section, None, unquote)
+        value = value.strip() if value is not None else None
+        return value if value else fallback
+
+    def get_multiline(self, key, section="main", fallback=[], keep_empty_lines=False):
+        value = self.get(key, section, None)
+        if value is None:
+            return fallback
+        lines = [line.strip() for line in value.splitlines()]
+        return lines if keep_empty_lines else [line for line in lines if line]
+
+    def get_int(self, key, section="main", fallback=None, min=None, max=None):
+        try:
+            value = int(self.get_stripped(key, section), base=0)
+        except (TypeError, ValueError):
+            return fallback
+        if (min is not None and value < min) or (max is not None and value > max):
+            return fallback
+        return value
+
+    def get_float(self, key, section="main", fallback=None, min=None, max=None):
+        try:
+            value = float(self.get_stripped(key, section))
+        except (TypeError, ValueError):
+            return fallback
+        if (min is not None and value < min) or (max is not None and value > max):
+            return fallback
+        return value
+
+    def get_bool(self, key, section="main", fallback=None):
+        value = self.get_stripped(key, section)
+        if value is None:
+            return fallback
+        return value.lower() in self.TRUE_VALUES
+
+class Plugin:
+    """Records what the plugin publishes instead of showing it"""
+
+    # Stand-in only: the settings returned by load_settings()
+    settings = Settings()
+
+    def __init__(self):
+        self.catalog = []
+        self.suggestions = []
+        self.verbose = False
+
+    def id(self):
+        return 1
+
+    def _log(self, level, *args):
+        if self.verbose or level in ("ERROR", "WARNING"):
+            print(f"[{level}]", *args, file=sys.stderr)
+
+    def info(self, *args):
+        self._log("INFO", *args)
+
+    def warn(self, *args):
+        self._log("WARNING", *args)
+
+    def err(self, *args):
+        self._log("ERROR", *args)
+
+    def dbg(self, *args):
+        self._log("DEBUG", *args)
+
+    def log(self, *args):
+        self._log("LOG", *args)
+
+    def load_settings(self):
+        return self.settings
+
+    def load_text_resource(self, path):
+        with open(os.path.join(PACKAGE_FOLDER, *path.replace("\\", "/").split("/")), "r", encoding="utf-8") as f:
+            return f.read()
+
+    def create_item(self, **kwargs):
+        return CatalogItem(**kwargs)
+
+    def set_catalog(self, catalog):
+        self.catalog = catalog
+
+    def set_suggestions(self, suggestions, match_method=Match.DEFAULT, sort_method=Sort.DEFAULT):
+        self.suggestions = suggestions
+
+    def should_terminate(self, wait=None):
+        return False
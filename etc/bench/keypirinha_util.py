@@ -0,0 +1,22 @@
+#
+# Pure-Python stand-in for the parts of keypirinha_util used by Ppl. See bench.py
+#
+import urllib.parse
+
+# Stand-in only: what the plugin copied and executed, most recent last
+clipboard = []
+executed = []
+
+def kwargs_encode(**kwargs):
+    return urllib.parse.urlencode(kwargs)
+
+def kwargs_decode(data):
+    return dict(urllib.parse.parse_qsl(data, keep_blank_values=True))
+
+def set_clipboard(text):
+    clipboard.append(text)
+
+def shell_execute(thing, args="", working_dir="", verb="", try_runas=True, detect_nongui=True,
+                  api_flags=None, terminal_cmd=None, show=-1):
+    executed.append(thing)
+    return True
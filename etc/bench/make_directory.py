@@ -0,0 +1,113 @@
+#
+# Generates a fake organization directory for running etc/make_contacts.py
+# offline: people spread over nested OUs (departments and their teams),
+# written as an LDIF file or as a folder tree of .json entries (see
+# FakeDirectory in make_contacts.py). With --churn, a fraction of the people
+# get another title and phone, and --remove drops some, keeping the others'
+# ids, so that successive exports show changes.
+#
+# Usage:
+#   $ python make_directory.py 100000 directory.ldif
+#   $ python make_directory.py 100000 directory --tree
+#   $ python make_directory.py 100000 directory.ldif --churn 0.01 --remove 0.001
+#
+import argparse
+import base64
+import json
+import os
+import random
+import shutil
+import uuid
+
+import make_vcards
+
+BASE_DN = "DC=acme,DC=com"
+CONTACTS_OU = "OU=Employees"
+TEAMS = 4
+
+def people(count, seed, churn=0.0, remove=0.0):
+    """ Yields the (department, team, id, attributes) of count people """
+    rng = random.Random(seed)
+    changes = random.Random(seed + 1)
+    for number in range(count):
+        first, last = rng.choice(make_vcards.FIRST_NAMES), rng.choice(make_vcards.LAST_NAMES)
+        department = rng.choice(make_vcards.DEPARTMENTS)
+        team = rng.randrange(TEAMS)
+        entry_id = uuid.UUID(int=rng.getrandbits(128))
+        user = f"{first}.{last}".lower().replace(" ", "").replace("'", "")
+        user = user.encode("ascii", "ignore").decode("ascii") or "user"
+        attrs = {
+            "cn": f"{first} {last} {number}",
+            "displayName": f"{first} {last}{number}",
+            "mail": f"{user}{number}@acme.com",
+            "company": "Acme Inc.",
+            "department": department,
+            "title": rng.choice(make_vcards.TITLES),
+            "telephoneNumber": make_vcards.phone(rng, 781),
+            "mobile": make_vcards.phone(rng, 617),
+        }
+        if changes.random() < remove:
+            continue
+        if changes.random() < churn:
+            attrs["title"] = changes.choice(make_vcards.TITLES) + " II"
+            attrs["mobile"] = make_vcards.phone(changes, 857)
+        yield department, team, entry_id, attrs
+
+def ou_dn(department, team=None):
+    department = department.replace("&", "and")
+    team_rdn = f"OU=Team {team}," if team is not None else ""
+    return f"{team_rdn}OU={department},{CONTACTS_OU},{BASE_DN}"
+
+def write_ldif(path, entries):
+    """ Writes the people under their OUs, as ldifde would """
+    def record(dn, attrs):
+        lines = [f"dn: {dn}"]
+        for name, value in attrs.items():
+            if isinstance(value, bytes):
+                lines.append(f"{name}:: {base64.b64encode(value).decode('ascii')}")
+            elif not value.isascii():
+                lines.append(f"{name}:: {base64.b64encode(value.encode('utf-8')).decode('ascii')}")
+            else:
+                lines.append(f"{name}: {value}")
+        return "\n".join(lines) + "\n\n"
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("version: 1\n\n")
+        f.write(record(BASE_DN, {"objectClass": "domain", "dc": "acme"}))
+        f.write(record(f"{CONTACTS_OU},{BASE_DN}", {"objectClass": "organizationalUnit", "ou": "Employees"}))
+        for department in make_vcards.DEPARTMENTS:
+            f.write(record(ou_dn(department), {"objectClass": "organizationalUnit", "ou": department}))
+            for team in range(TEAMS):
+                f.write(record(ou_dn(department, team), {"objectClass": "organizationalUnit", "ou": f"Team {team}"}))
+        for department, team, entry_id, attrs in entries:
+            cn = attrs["cn"].replace(",", "\\,")
+            f.write(record(f"CN={cn},{ou_dn(department, team)}",
+                dict(objectClass="user", objectGUID=entry_id.bytes_le, **attrs)))
+
+def write_tree(path, entries):
+    """ Writes the people as .json files in department/team folders """
+    shutil.rmtree(path, ignore_errors=True)
+    for department, team, entry_id, attrs in entries:
+        folder = os.path.join(path, department.replace("&", "and"), f"Team {team}")
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, f"{entry_id}.json"), "w", encoding="utf-8") as f:
+            json.dump(attrs, f)
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a fake directory for make_contacts.py")
+    parser.add_argument("count", type=int, help="number of people")
+    parser.add_argument("path", help="output LDIF file, or folder with --tree")
+    parser.add_argument("--tree", action="store_true", help="write a folder tree of .json entries")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--churn", type=float, default=0.0, help="fraction of people whose title and phone change")
+    parser.add_argument("--remove", type=float, default=0.0, help="fraction of people left out")
+    args = parser.parse_args()
+
+    entries = people(args.count, args.seed, args.churn, args.remove)
+    if args.tree:
+        write_tree(args.path, entries)
+    else:
+        write_ldif(args.path, entries)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+#
+# Generates realistic vCard files for benchmarking Ppl: contacts have one to
+# three phones, emails, titles, organizations, nicknames and notes and mix the
+# vCard 2.1, 3.0 and 4.0 ways of tagging phones and encoding values (quoted
+# printable, folded lines, escaped separators). The same contacts can be
+# written as NDJSON or CSV files of directory attributes instead.
+#
+# Usage:
+#   $ python make_vcards.py 100000 contacts.vcf
+#   $ python make_vcards.py 1000000 contacts.vcf --files 3 --encodings utf-8,utf-16,cp1252
+#   $ python make_vcards.py 100000 contacts.json --format json
+#
+# The [vcf/...] ([json/...], [csv/...]) sections that configure the generated
+# files are printed.
+#
+import argparse
+import csv
+import json
+import os
+import quopri
+import random
+
+FIRST_NAMES = ["John", "Jane", "Joe", "Sue", "Ari", "Bob", "Jack", "Frank", "Dana", "Anna", "Andre", "Josh",
+    "Mary", "Mark", "Dan", "Danielle", "Lucas", "Maria", "Olga", "Ivan", "Noa", "Yael", "Avi", "Moshe",
+    "Chen", "Wei", "Priya", "Ravi", "Fatima", "Omar", "José", "Zoë", "François", "Søren", "Jürgen", "Ángel"]
+LAST_NAMES = ["Doe", "Sold", "Comfort", "Costly", "Tucker", "Dormant", "Smith", "Cohen", "Levi", "Brown",
+    "Kim", "Nguyen", "Katz", "Peres", "Mizrahi", "Andersson", "O'Brien", "Müller", "García", "Lefèvre",
+    "Ødegaard", "Núñez", "Van der Berg", "De la Cruz"]
+# Names which only Unicode encodings can hold
+UNICODE_NAMES = [("Дмитрий", "Иванов"), ("אבי", "כהן"), ("明", "王"), ("さくら", "佐藤"), ("Γιώργος", "Παππάς")]
+NICKNAMES = ["JD", "Red", "Chip", "Doc", "Ace", "Bubba", "Sunny", "Max"]
+TITLES = ["Developer", "Architect", "Controller", "Sales Director", "Support Engineer",
+    "VP, Finance", "Driver", "Manager; EMEA", "Product Owner", "Intern"]
+DEPARTMENTS = ["R&D", "Finance", "Sales", "Support", "Operations", "Legal", "HR"]
+# Columns of the NDJSON and CSV files, named after directory attributes, and
+# the [json/...] and [csv/...] settings mapping them to the contact fields
+COLUMNS = ["displayName", "givenName", "sn", "mail", "otherMailbox", "mobile", "telephoneNumber", "homePhone",
+    "title", "company", "department", "nickname", "info"]
+FIELD_COLUMNS = {"name": "displayName", "mail": "mail, otherMailbox", "cell": "mobile", "work": "telephoneNumber",
+    "home": "homePhone", "org": "company, department", "note": "info"}
+
+# (vCard version, cell, work, home) phone tag styles
+TAG_STYLES = [
+    ("3.0", "TYPE=CELL", "TYPE=WORK", "TYPE=HOME"),
+    ("2.1", "CELL;VOICE", "WORK;VOICE", "HOME;VOICE"),
+    ("4.0", 'TYPE="cell,voice"', 'TYPE="work,voice"', 'TYPE="home,voice"'),
+    ("3.0", "type=cell", "type=work", "type=home"),
+]
+
+def fold(line, width=75):
+    """ Folds a content line the vCard way: continuation lines start with a
+    space. Quoted printable values come with their own soft line breaks """
+    if len(line) <= width or "QUOTED-PRINTABLE" in line:
+        return line + "\r\n"
+    parts = [line[:width]]
+    line = line[width:]
+    while line:
+        parts.append(" " + line[:width - 1])
+        line = line[width - 1:]
+    return "\r\n".join(parts) + "\r\n"
+
+def escape(value):
+    return value.replace("\\", "\\\\").replace(",", "\\,").replace(";", "\\;").replace("\n", "\\n")
+
+def phone(rng, area):
+    return f"+1 ({area}) {rng.randint(200, 999)}-{rng.randint(0, 9999):04d}"
+
+def person(rng, number, unicode_names):
+    """ Returns the fields of one random contact """
+    if unicode_names and rng.random() < 0.05:
+        first, last = rng.choice(UNICODE_NAMES)
+    else:
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+    name = f"{first} {last}"
+    if rng.random() < 0.2:
+        name = f"{first} {rng.choice(FIRST_NAMES)[0]}. {last}"
+    version, cell_tag, work_tag, home_tag = rng.choice(TAG_STYLES)
+    user = f"{first}.{last}".lower().replace(" ", "").replace("'", "")
+    user = user.encode("ascii", "ignore").decode("ascii") or "user"
+    domain = rng.choice(["acme.com", "example.org", "mail.example.net"])
+
+    fields = {"name": f"{name}{number}", "first": first, "last": last, "version": version,
+        "tags": (cell_tag, work_tag, home_tag), "cell": phone(rng, 617)}
+    if rng.random() < 0.6:
+        fields["work"] = phone(rng, 781)
+    if rng.random() < 0.3:
+        fields["home"] = phone(rng, 508)
+    if rng.random() < 0.9:
+        fields["mail"] = f"{user}{number}@{domain}"
+    if rng.random() < 0.2:
+        fields["pref_mail"] = f"{user}{number}@work.{domain}"
+    if rng.random() < 0.8:
+        fields["title"] = rng.choice(TITLES)
+        fields["department"] = rng.choice(DEPARTMENTS)
+    if rng.random() < 0.1:
+        fields["nickname"] = rng.choice(NICKNAMES)
+    if rng.random() < 0.15:
+        fields["note"] = f"Met at the {rng.randint(2000, 2024)} offsite, works with {rng.choice(FIRST_NAMES)} on " \
+            f"{rng.choice(DEPARTMENTS)} projects; prefers calls after {rng.randint(8, 11)}am"
+    return fields
+
+def vcard(rng, number, unicode_names):
+    """ Returns the text of one random vCard """
+    fields = person(rng, number, unicode_names)
+    version = fields["version"]
+    cell_tag, work_tag, home_tag = fields["tags"]
+    lines = ["BEGIN:VCARD", f"VERSION:{version}", f"FN:{fields['name']}", f"N:{fields['last']};{fields['first']};;;"]
+    lines.append(f"TEL;{cell_tag}:{fields['cell']}")
+    if "work" in fields:
+        lines.append(f"TEL;{work_tag}:{fields['work']}")
+    if "home" in fields:
+        lines.append(f"TEL;{home_tag}:{fields['home']}")
+    if "mail" in fields:
+        lines.append(f"EMAIL;TYPE=INTERNET:{fields['mail']}")
+    if "pref_mail" in fields:
+        lines.append(f"EMAIL;TYPE=INTERNET;TYPE=PREF:{fields['pref_mail']}")
+    if "title" in fields:
+        lines.append(f"TITLE:{escape(fields['title'])}")
+        lines.append(f"ORG:Acme Inc.;{escape(fields['department'])}")
+    if "nickname" in fields:
+        lines.append(f"NICKNAME:{fields['nickname']}")
+    if "note" in fields:
+        note = fields["note"]
+        if version == "2.1":
+            encoded = quopri.encodestring(note.encode("utf-8")).decode("ascii").replace("=\n", "=\r\n")
+            lines.append(f"NOTE;CHARSET=UTF-8;ENCODING=QUOTED-PRINTABLE:{encoded}")
+        else:
+            lines.append(f"NOTE:{escape(note)}")
+    lines.append("END:VCARD")
+    return "".join(fold(line) for line in lines)
+
+def record(rng, number, unicode_names):
+    """ Returns one random contact as the directory attributes of COLUMNS """
+    fields = person(rng, number, unicode_names)
+    mails = [mail for mail in (fields.get("pref_mail"), fields.get("mail")) if mail]
+    values = {"displayName": fields["name"], "givenName": fields["first"], "sn": fields["last"],
+        "mail": mails[0] if mails else "", "otherMailbox": mails[1] if len(mails) > 1 else "",
+        "mobile": fields["cell"], "telephoneNumber": fields.get("work", ""), "homePhone": fields.get("home", ""),
+        "title": fields.get("title", ""), "company": "Acme Inc." if "title" in fields else "",
+        "department": fields.get("department", ""), "nickname": fields.get("nickname", ""),
+        "info": fields.get("note", "")}
+    return {column: values[column] for column in COLUMNS}
+
+def section(path, encoding, format="vcf"):
+    """ Returns the Ppl configuration section of a generated file """
+    text = f"[{format}/{os.path.basename(path)}]\nencoding = {encoding}\n"
+    if format != "vcf":
+        text += "".join(f"{field} = {columns}\n" for field, columns in FIELD_COLUMNS.items())
+    return text
+
+def generate(path, count, encoding="utf-8", seed=1, start=0, format="vcf"):
+    """ Writes count random contacts, numbered from start, to path as vCards,
+    NDJSON (format "json") or CSV """
+    rng = random.Random(seed * 1000003 + start)
+    unicode_names = encoding.lower().replace("_", "-").startswith("utf")
+    with open(path, "w", encoding=encoding, newline="") as f:
+        if format == "csv":
+            writer = csv.DictWriter(f, COLUMNS, lineterminator="\r\n")
+            writer.writeheader()
+        batch = []
+        for number in range(start, start + count):
+            if format == "vcf":
+                batch.append(vcard(rng, number, unicode_names))
+            elif format == "json":
+                batch.append(json.dumps({column: value for column, value in record(rng, number, unicode_names).items()
+                    if value}, ensure_ascii=False) + "\n")
+            else:
+                writer.writerow(record(rng, number, unicode_names))
+            if len(batch) == 1000:
+                f.write("".join(batch))
+                batch = []
+        f.write("".join(batch))
+
+def generate_files(path, count, files=1, encodings=("utf-8",), seed=1, format="vcf"):
+    """ Splits count contacts over files contacts files, cycling the encodings.
+    Returns the (file path, encoding) of the generated files """
+    generated = []
+    root, ext = os.path.splitext(path)
+    for i in range(files):
+        file_path = path if files == 1 else f"{root}-{i + 1}{ext}"
+        encoding = encodings[i % len(encodings)]
+        start = count * i // files
+        generate(file_path, count * (i + 1) // files - start, encoding, seed, start, format)
+        generated.append((file_path, encoding))
+    return generated
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate contacts files for benchmarking Ppl")
+    parser.add_argument("count", type=int, help="number of contacts")
+    parser.add_argument("path", help="output contacts file (numbered when there are several)")
+    parser.add_argument("--files", type=int, default=1, help="number of files to split the contacts over")
+    parser.add_argument("--encodings", default="utf-8", help="comma separated encodings cycled over the files")
+    parser.add_argument("--format", choices=["vcf", "json", "csv"], default="vcf",
+        help="vCard, NDJSON or CSV files")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    for file_path, encoding in generate_files(args.path, args.count, args.files, args.encodings.split(","), args.seed,
+            args.format):
+        print(section(file_path, encoding, args.format))
+
+if __name__ == "__main__":
+    main()
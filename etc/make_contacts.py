@@ -8,21 +8,45 @@
 #      $ pip install pywin32
 # 2. This program relies on the user's Windows Authentication to access AD.
 # 3. Various companies use different attributes in their contacts objects
-#    in AD. The attributes used here are defined in CONTACT_AD_ATTRS, your
+#    in AD. The attributes used here are defined in AD_ATTR_MAP, your
 #    organization may differ. The best tool to use to find what attributes
 #    are used in your organization is the Microsoft ADExplorer.exe program
 #    (see https://docs.microsoft.com/en-us/sysinternals/downloads/adexplorer)
-# 4. The contacts.json generated by this program should be placed in 
+# 4. The VCF file generated by this program should be placed in
 #    Keypirinha's User folder ({Keypirinha-Root-Dir}\portable\Profile\User)
+#    or be the 'source' of a [vcf/...] section of the Ppl configuration
 # 5. Note that the Ppl plugin will ignore contacts that do not at least the
-#    first attribute (displayName here)
+#    first attribute (displayName here), these are not exported
+#
+# Usage:
+#   $ python make_contacts.py [ad-contacts.vcf] [--ou OU=Employees] [--workers 8]
+#
+# The OUs are scanned concurrently, each with paged directory queries that
+# return a page of entries with all their attributes at once, and the
+# contacts are written as they arrive. A hash of every exported entry is
+# kept next to the VCF file (ad-contacts.vcf.hashes.json) so that the next
+# export tells which entries were added, changed or removed and leaves the
+# VCF file untouched when nothing changed.
+#
+# With --journal, a change does not rewrite the VCF file: the cards of the
+# added, changed and removed entries (the latter with only their UID) are
+# appended to ad-contacts.vcf.journal, which Ppl applies on top of the VCF
+# file it already loaded. The VCF file is rewritten, and the journal
+# removed, once the journal holds a tenth of the entries or is a week old,
+# or with --compact. Copy both files, or have Ppl copy them from 'source'.
+#
+# The same export runs offline, without pywin32, against an LDIF file or a
+# fake directory: a folder tree whose folders are OUs and whose .json files
+# are entries (objects of AD attributes):
+#   $ python make_contacts.py contacts.vcf --ldif directory.ldif
+#   $ python make_contacts.py contacts.vcf --fake-dir directory
 #
 # Note: If you do not want to permanently install the pywin32 package in
 # your environment, you can set a disposable virtual environment as follows:
-# 
+#
 # # {ensure you have Python 3.6+ installed)
 # $ python -m venv tempenv
-# $ cd tempenv 
+# $ cd tempenv
 # $ .\Scripts\activate.bat
 # $ pip install pywin32
 # {now you can run make_contacts.py}
@@ -30,19 +54,25 @@
 # {finally you can delete the virtual environment - unless you may want to repeat in future}
 # $ cd ..
 # $ rmdir /s /q tempenv
-import win32com.client
+import argparse
+import base64
+import hashlib
 import io
-import os
-import sys
 import json
-import datetime
+import os
+import queue
+import re
 import shutil
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 # Name of the VCF file created out of the AD entries
 VCF_FILE = "ad-contacts.vcf"
 
 # The Active Directory OU (organization unit) where the contacts are
-# This may change between organizations 
+# This may change between organizations
 CONTACTS_OU = "OU=Employees"
 
 # Map between CN (common name) attributes (in order) and the equivalent VCF properties:
@@ -57,100 +87,409 @@ AD_ATTR_MAP = {
     "mobile": "TEL;TYPE=CELL"
 }
 
-REQUIRED_ATTRS = ["mail", "telephoneNumber", "mobile"]
-
 VCF_ESCAPES = str.maketrans({
-    ",":    r"\,", 
-    ";": r"\;", 
-    "\\":   r"\\", 
+    ",":    r"\,",
+    ";": r"\;",
+    "\\":   r"\\",
     "\n":   r"\\n"})
 
-def add_cn(adobj, entries):
-    n_required = 0
-    entry = {}
-    for attr in AD_ATTR_MAP.keys():
-        try:
-            val = getattr(adobj,attr)
-            if val != None:
-                val = val.translate(VCF_ESCAPES)
-                if AD_ATTR_MAP[attr] in entry:
-                    entry[AD_ATTR_MAP[attr]] += ";"+val
+# Entries per directory query page, OUs scanned at once and entries queued
+# between the scanning threads and the writer
+PAGE_SIZE = 1000
+WORKERS = 8
+QUEUE_SIZE = 10000
+
+# The entry hashes of the last export, next to the VCF file
+HASHES_SUFFIX = ".hashes.json"
+HASHES_VERSION = 2
+
+# With --journal, the changes are appended to the journal next to the VCF
+# file and the VCF file is only rewritten (compacted) once the journal holds
+# more changes than COMPACT_RATIO of the entries or is COMPACT_DAYS old
+JOURNAL_SUFFIX = ".journal"
+COMPACT_RATIO = 0.1
+COMPACT_DAYS = 7
+
+class AdDirectory:
+    """Active Directory, searched through ADSI with paged one level queries"""
+    # Containers that hold no people
+    SKIPPED = ("Active Directory Connections",)
+
+    def __init__(self, ou=CONTACTS_OU, base=None):
+        import pythoncom
+        import win32com.client
+        self.pythoncom = pythoncom
+        self.client = win32com.client
+        self.ou = ou
+        self.base = base
+        # COM objects belong to the thread that created them
+        self.local = threading.local()
+
+    def root(self):
+        if not self.base:
+            # Auto-discovers the AD LDAP base location
+            print("Finding your Active Directory LDAP base location...")
+            self.base = self.client.GetObject('LDAP://rootDSE').Get("defaultNamingContext")
+            print(f"Found base location: LDAP://{self.base}")
+        return ",".join(part for part in (self.ou, self.base) if part)
+
+    def command(self, page_size):
+        command = getattr(self.local, "command", None)
+        if command is None:
+            self.pythoncom.CoInitialize()
+            connection = self.client.Dispatch("ADODB.Connection")
+            connection.Provider = "ADsDSOObject"
+            connection.Open("Active Directory Provider")
+            command = self.client.Dispatch("ADODB.Command")
+            command.ActiveConnection = connection
+            command.Properties("Page Size").Value = page_size
+            # ADS_SCOPE_ONELEVEL, sub OUs are scanned by their own queries
+            command.Properties("Searchscope").Value = 1
+            self.local.connection, self.local.command = connection, command
+        return command
+
+    def pages(self, container, page_size):
+        """ Yields the lists of ("ou", path) and ("entry", id, attributes) of
+        the children of a container, a page at a time """
+        command = self.command(page_size)
+        attrs = ["objectGUID", "cn", "ou"] + list(AD_ATTR_MAP)
+        command.CommandText = f"SELECT {', '.join(attrs)} FROM 'LDAP://{container}'"
+        records, _ = command.Execute()
+        page = []
+        while not records.EOF:
+            values = {attr: records.Fields.Item(attr).Value for attr in attrs}
+            if values["cn"] is not None:
+                if values["cn"] not in self.SKIPPED:
+                    page.append(("entry", bytes(values["objectGUID"]).hex(), values))
+            elif values["ou"] is not None:
+                page.append(("ou", f"OU={values['ou']},{container}"))
+            if len(page) == page_size:
+                yield page
+                page = []
+            records.MoveNext()
+        if page:
+            yield page
+
+class LdifDirectory:
+    """Entries of an LDIF file (e.g. exported with ldifde), records having a
+    cn being entries and the others OUs"""
+    DN_SEPARATOR = re.compile(r"(?<!\\),")
+
+    def __init__(self, path, base=None):
+        self.base = base
+        records = list(self.read_records(path))
+        dns = {dn.lower() for dn, _ in records}
+        self.children = {}
+        for dn, attrs in records:
+            parts = self.DN_SEPARATOR.split(dn, 1)
+            # Records whose parent is not in the file are the top ones
+            parent = parts[1].strip().lower() if len(parts) > 1 else ""
+            parent = parent if parent in dns else ""
+            if "cn" in attrs:
+                guid = attrs.get("objectGUID")
+                entry_id = guid.hex() if isinstance(guid, bytes) else dn.lower()
+                child = ("entry", entry_id, attrs)
+            else:
+                child = ("ou", dn)
+            self.children.setdefault(parent, []).append(child)
+
+    @staticmethod
+    def read_records(path):
+        """ Yields the (dn, attributes) of the records of an LDIF file. Base64
+        values are decoded, to str unless binary, and repeated attributes
+        make tuples """
+        def record(lines):
+            attrs = {}
+            for line in lines:
+                name, _, value = line.partition(":")
+                if value.startswith(":"):
+                    value = base64.b64decode(value[1:].strip())
+                    try:
+                        value = value.decode("utf-8")
+                    except UnicodeDecodeError:
+                        pass
                 else:
-                    entry[AD_ATTR_MAP[attr]] = val
-        except Exception as exc:
-            print(f"No attr {attr} for {adobj.cn}")
-            pass
-            
-        if attr in REQUIRED_ATTRS:
-            n_required += 1
-
-    if n_required == len(REQUIRED_ATTRS):
-        print(f"Adding {adobj.cn}")
-        entries.append(entry)
-
-def scan_ou_s(ldap_path, entries):
-    global cnt
-    print(f"Scanning LDAP path: LDAP://{ldap_path}")
-    for o in win32com.client.GetObject(f"LDAP://{ldap_path}"):
-        if o.cn == 'Active Directory Connections':
+                    value = value.strip()
+                if name in attrs:
+                    previous = attrs[name]
+                    attrs[name] = (previous if isinstance(previous, tuple) else (previous,)) + (value,)
+                else:
+                    attrs[name] = value
+            return attrs
+
+        lines = []
+        with io.open(path, "r", encoding="utf-8-sig") as f:
+            for line in f:
+                line = line.rstrip("\r\n")
+                if line.startswith(" ") and lines:
+                    lines[-1] += line[1:]
+                elif not line:
+                    if lines:
+                        attrs = record(lines)
+                        if "dn" in attrs:
+                            yield attrs.pop("dn"), attrs
+                        lines = []
+                elif not line.startswith("#") and not line.startswith("version:"):
+                    lines.append(line)
+        if lines:
+            attrs = record(lines)
+            if "dn" in attrs:
+                yield attrs.pop("dn"), attrs
+
+    def root(self):
+        return self.base or ""
+
+    def pages(self, container, page_size):
+        children = self.children.get(container.lower(), [])
+        for start in range(0, len(children), page_size):
+            yield children[start:start + page_size]
+
+class FakeDirectory:
+    """A folder tree standing for a directory: folders are OUs and .json
+    files entries, objects of AD attributes, whose id is their path"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def root(self):
+        return self.path
+
+    def pages(self, container, page_size):
+        page = []
+        with os.scandir(container) as children:
+            for child in sorted(children, key=lambda child: child.name):
+                if child.is_dir():
+                    page.append(("ou", child.path))
+                elif child.name.endswith(".json"):
+                    with io.open(child.path, "r", encoding="utf-8") as f:
+                        attrs = json.load(f)
+                    attrs.setdefault("cn", child.name[:-len(".json")])
+                    entry_id = os.path.relpath(child.path, self.path).replace(os.sep, "/")
+                    page.append(("entry", entry_id, attrs))
+                if len(page) == page_size:
+                    yield page
+                    page = []
+        if page:
+            yield page
+
+def scan_directory(directory, workers=WORKERS, page_size=PAGE_SIZE):
+    """ Yields the (id, attributes) of the entries of a directory as they are
+    found, the OUs being scanned concurrently by up to workers threads.
+    Raises RuntimeError if any OU failed to scan, once the others are done """
+    entries = queue.Queue(QUEUE_SIZE)
+    lock = threading.Lock()
+    pending = [1]
+    failures = []
+    stopped = threading.Event()
+    done = object()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        def scan(container):
+            try:
+                if stopped.is_set():
+                    return
+                print(f"Scanning {container}")
+                for page in directory.pages(container, page_size):
+                    if stopped.is_set():
+                        return
+                    for child in page:
+                        if child[0] == "ou":
+                            with lock:
+                                pending[0] += 1
+                            pool.submit(scan, child[1])
+                        else:
+                            entries.put(child[1:])
+            except Exception as exc:
+                print(f"Failed to scan {container}. {exc}")
+                failures.append(container)
+            finally:
+                with lock:
+                    pending[0] -= 1
+                    if not pending[0]:
+                        entries.put(done)
+
+        pool.submit(scan, directory.root())
+        entry = None
+        try:
+            while True:
+                entry = entries.get()
+                if entry is done:
+                    break
+                yield entry
+        finally:
+            # When the caller gives up, let the scanning threads run out
+            if entry is not done:
+                stopped.set()
+                while entries.get() is not done:
+                    pass
+
+    if failures:
+        raise RuntimeError(f"{len(failures)} OU(s) failed to scan")
+
+def vcard_entry(entry_id, attrs):
+    """ Returns the VCF card of a directory entry, None if it has no name.
+    The card UID is the entry id, which Ppl applies journal records by """
+    entry = {}
+    for attr, prop in AD_ATTR_MAP.items():
+        val = attrs.get(attr)
+        if isinstance(val, (tuple, list)):
+            val = val[0] if val else None
+        if val is None or val == "":
             continue
-        elif o.cn is not None:
-            add_cn(o, entries)
-        elif o.ou != None:
-            scan_ou_s(f"OU={o.ou},{ldap_path}", entries)
-
-# This function tries to auto-discover the AD LDAP base location 
-print("Finding your Active Directory LDAP base location...")
-try:
-    ldap_loc=win32com.client.GetObject('LDAP://rootDSE').Get("defaultNamingContext")
-except Exception as exc:
-    print(f"Failed to find LDAP base location. {exc}")
-    sys.exit(1)
-
-print(f"Found base location: LDAP://{ldap_loc}")
-
-entries = []
-scan_loc = ",".join([CONTACTS_OU, ldap_loc])
-scan_ou_s(scan_loc, entries)
-
-vcf_file = sys.argv[1] if len(sys.argv) > 1 else VCF_FILE
-new_vcf_file = f"{vcf_file}-{str(datetime.datetime.now()).replace(' ','T').replace(':','.')}"
-
-print(f"Writing contacts to {new_vcf_file}")
-try:
-    with io.open(new_vcf_file, 'w', encoding='utf8') as outfile:
-        for entry in entries:
-            outfile.write(f"BEGIN:VCARD\n")
-            outfile.write(f"VERSION:3.0\n")
-            for item in entry:
-                outfile.write(f"{item}:{entry[item]}\n")   
-            outfile.write(f"END:VCARD\n")
-except Exception as exc:
-    print(f"Failed to write new contact list {new_vcf_file}. {exc}")
-    sys.exit(2)
-
-print("Checking for new contact data")
-try:
-    with io.open(vcf_file, 'r') as old_file:
-        old_data = old_file.readlines()
-    with io.open(new_vcf_file, 'r') as new_file:
-        new_data = new_file.readlines()
-except Exception as exc:
-    print(f"Failed to compare old and new contact list. {exc}")
-    sys.exit(3)
-
-if old_data == new_data:
-    print(f"No contact changes found. No change performed.")
+        val = str(val).translate(VCF_ESCAPES)
+        if prop in entry:
+            entry[prop] += ";"+val
+        else:
+            entry[prop] = val
+    if "FN" not in entry:
+        return None
+    return f"BEGIN:VCARD\nVERSION:3.0\nUID:{entry_id.translate(VCF_ESCAPES)}\n" + \
+        "".join(f"{item}:{entry[item]}\n" for item in entry) + "END:VCARD\n"
+
+def journal_record(card, change):
+    """ Returns the journal record of a card: the card with its change, one
+    of ADD, MODIFY or DELETE. A deleted entry's record is the card of its
+    UID alone """
+    head, _, body = card.partition("\nFN:")
+    if change == "DELETE":
+        return f"{head}\nX-PPL-CHANGE:{change}\nEND:VCARD\n"
+    return f"{head}\nX-PPL-CHANGE:{change}\nFN:{body}"
+
+def entry_hash(card):
+    return hashlib.blake2b(card.encode("utf-8"), digest_size=8).hexdigest()
+
+def load_state(path):
+    """ Returns the state of the last export, the entry id -> hash "entries"
+    and its "journal" {"since", "changes"}, None if unknown """
     try:
-        os.remove(new_vcf_file)
-    except:
+        with io.open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("version") == HASHES_VERSION:
+            return state
+    except FileNotFoundError:
         pass
-    sys.exit(0)
-else:
+    except Exception as exc:
+        print(f"Ignoring unreadable entry hashes {path}. {exc}")
+    return None
+
+def save_state(path, hashes, journal=None):
+    with io.open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"version": HASHES_VERSION, "entries": hashes, "journal": journal}, f)
+    os.replace(path + ".tmp", path)
+
+def export(directory, vcf_file, workers=WORKERS, page_size=PAGE_SIZE, journal=False, compact=False):
+    """ Writes the contacts of a directory to vcf_file unless they did not
+    change since the last export. With journal, the changes are appended to
+    the journal instead, until it is due for compaction (or compact is set)
+    and vcf_file is rewritten. Returns the (added, changed, removed) entry
+    counts """
+    hashes_file = vcf_file + HASHES_SUFFIX
+    journal_file = vcf_file + JOURNAL_SUFFIX
+    state = load_state(hashes_file) if os.path.exists(vcf_file) else None
+    previous = state["entries"] if state else {}
+    journal_state = state.get("journal") if state else None
+    if journal_state and not os.path.exists(journal_file):
+        # The VCF file alone lacks the journaled changes
+        compact = True
+    hashes = {}
+    # The cards of the added and changed entries, while few enough to journal
+    changes = {} if journal and previous and not compact else None
+    max_changes = COMPACT_RATIO * len(previous)
+    new_vcf_file = vcf_file + ".tmp"
+    start = time.perf_counter()
+
+    print(f"Writing contacts to {new_vcf_file}")
+    try:
+        with io.open(new_vcf_file, 'w', encoding='utf8') as outfile:
+            for entry_id, attrs in scan_directory(directory, workers, page_size):
+                card = vcard_entry(entry_id, attrs)
+                if card is None or entry_id in hashes:
+                    continue
+                digest = hashes[entry_id] = entry_hash(card)
+                if changes is not None and previous.get(entry_id) != digest:
+                    changes[entry_id] = card
+                    if len(changes) > max_changes:
+                        changes = None
+                outfile.write(card)
+    except BaseException:
+        os.remove(new_vcf_file)
+        raise
+    print(f"Exported {len(hashes)} contacts in {time.perf_counter() - start:.1f}s")
+
+    added = sum(1 for entry_id in hashes if entry_id not in previous)
+    changed = sum(1 for entry_id, digest in hashes.items() if previous.get(entry_id, digest) != digest)
+    removed = [entry_id for entry_id in previous if entry_id not in hashes]
+    if not (added or changed or removed) and previous and not compact:
+        os.remove(new_vcf_file)
+        return 0, 0, 0
+
+    journaled = (journal_state["changes"] if journal_state else 0) + added + changed + len(removed)
+    since = journal_state["since"] if journal_state else time.time()
+    if changes is None or journaled > max_changes or time.time() - since > COMPACT_DAYS * 24 * 3600:
+        # Compaction: the VCF file holds every change, the journal none
+        save_state(hashes_file, hashes)
+        os.replace(new_vcf_file, vcf_file)
+        if os.path.exists(journal_file):
+            os.remove(journal_file)
+            print(f"Compacted {journal_file} into {vcf_file}")
+        return added, changed, len(removed)
+
+    os.remove(new_vcf_file)
+    print(f"Appending the changes to {journal_file}")
+    with io.open(journal_file + ".tmp", 'w', encoding='utf8') as outfile:
+        if os.path.exists(journal_file):
+            with io.open(journal_file, 'r', encoding='utf8') as infile:
+                shutil.copyfileobj(infile, outfile)
+        for entry_id, card in changes.items():
+            outfile.write(journal_record(card, "MODIFY" if entry_id in previous else "ADD"))
+        for entry_id in removed:
+            outfile.write(journal_record(vcard_entry(entry_id, {"displayName": "-"}), "DELETE"))
+    os.replace(journal_file + ".tmp", journal_file)
+    save_state(hashes_file, hashes, {"since": since, "changes": journaled})
+    return added, changed, len(removed)
+
+def main():
+    parser = argparse.ArgumentParser(description="Export Active Directory contacts to a VCF file for Ppl")
+    parser.add_argument("vcf_file", nargs="?", default=VCF_FILE, help=f"VCF file to write (default {VCF_FILE})")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--ldif", help="export the entries of an LDIF file instead of Active Directory")
+    source.add_argument("--fake-dir", help="export a fake directory folder tree instead of Active Directory")
+    parser.add_argument("--ou", default=CONTACTS_OU, help=f"Active Directory OU of the contacts (default {CONTACTS_OU})")
+    parser.add_argument("--base", help="base DN, by default the Active Directory naming context or the LDIF top")
+    parser.add_argument("--workers", type=int, default=WORKERS, help=f"OUs scanned at once (default {WORKERS})")
+    parser.add_argument("--page-size", type=int, default=PAGE_SIZE, help=f"entries per query page (default {PAGE_SIZE})")
+    parser.add_argument("--journal", action="store_true", help=f"append the changes to the {JOURNAL_SUFFIX} file "
+        "next to the VCF file, which is rewritten when the journal is due for compaction")
+    parser.add_argument("--compact", action="store_true", help="rewrite the VCF file and remove the journal now")
+    args = parser.parse_args()
+
     try:
-        shutil.copy(new_vcf_file, vcf_file)
+        if args.ldif:
+            directory = LdifDirectory(args.ldif, args.base)
+        elif args.fake_dir:
+            directory = FakeDirectory(args.fake_dir)
+        else:
+            directory = AdDirectory(args.ou, args.base)
+            directory.root()
     except Exception as exc:
-        print(f"Failed to copy {new_vcf_file} over {vcf_file}. {exc}")
+        print(f"Failed to open the directory. {exc}")
+        sys.exit(1)
+
+    try:
+        added, changed, removed = export(directory, args.vcf_file, max(1, args.workers), max(1, args.page_size),
+            args.journal, args.compact)
+    except RuntimeError as exc:
+        print(f"Failed to scan the directory, {args.vcf_file} is left unchanged. {exc}")
+        sys.exit(3)
+    except Exception as exc:
+        print(f"Failed to write new contact list {args.vcf_file}. {exc}")
         sys.exit(2)
 
-print(f"Done")
+    if not (added or changed or removed):
+        print(f"No contact changes found. No change performed.")
+    else:
+        print(f"{added} contact(s) added, {changed} changed, {removed} removed")
+    print(f"Done")
+
+if __name__ == "__main__":
+    main()
@@ -7,18 +7,51 @@
 #
 # TODO
 # - Generalize actions to make it capture different email & phone types
-# - Keep hit history (requires switching from ref. by contact_no to ref by contact name, if unique)
 #
 import keypirinha as kp
 import keypirinha_util as kpu
 import json
-#import re
+import re
+import mmap
+import quopri
 from pathlib import Path
 import os
 import sys
 import datetime
-from shutil import copyfile
+import time
+import threading
+import queue
+import gc
+import hashlib
+import pickle
+import csv
 from encodings.aliases import aliases
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from contextlib import contextmanager
+import heapq
+import itertools
+import unicodedata
+try:
+    import sqlite3
+except ImportError:
+    # Not every embedded Python has it, the sqlite store is then unavailable
+    sqlite3 = None
+
+@contextmanager
+def paused_gc():
+    """ Disables the cyclic garbage collector for the block. Building the
+    contacts, their indexes or unpickling them makes many small objects, none
+    of them garbage, whose allocations would trigger collector passes
+    freeing nothing """
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if gc_enabled:
+            gc.enable()
 
 # Main actions
 # {CALL|HOME|CELL|WORK} - dial a phone of given contact name (for CALL defaults to first number in contact)
@@ -39,14 +72,1395 @@ class Verb(object):
         self.action = action
 
 class Contact(object):
-    name: str
-    mail: str
-    description: str
-    
-    def __init__(self, name="", mail="", description=""):
+    """A parsed contact. Directories may hold many thousands of these so
+    attributes are slotted and phones are kept as a tuple of
+    (field, number) pairs - e.g. ("TEL;TYPE=CELL", "+1 (617) 111-2222").
+    The uid, derived from the contact file, name and email, identifies the
+    contact across reloads. alt_mails holds the emails beside the main one,
+    sources the files of a contact merged from several files and details the
+    searchable (field, text) pairs - e.g. ("org", "Acme Inc.;Finance")"""
+    __slots__ = ("name", "mail", "description", "nickname", "phones", "uid", "alt_mails", "sources", "details")
+
+    def __init__(self, name="", mail="", description="", nickname="", phones=(), uid="", alt_mails=(), sources=(),
+                 details=()):
         self.name = name
         self.mail = mail
         self.description = description
+        self.nickname = nickname
+        self.phones = phones
+        self.uid = uid
+        self.alt_mails = alt_mails
+        self.sources = sources
+        self.details = details
+
+    def __reduce__(self):
+        # Compact and fast to (un)pickle in the contacts cache
+        return (Contact, (self.name, self.mail, self.description, self.nickname, self.phones, self.uid,
+            self.alt_mails, self.sources, self.details))
+
+    def __repr__(self):
+        return f"Contact({self.name!r}, {self.mail!r}, {self.description!r}, {self.nickname!r}, {self.phones!r}, " \
+            f"{self.uid!r}, {self.alt_mails!r}, {self.sources!r}, {self.details!r})"
+
+    def get(self, field, default=None):
+        """ Returns the value of a verb contact field ('name', 'mail', 'TEL;TYPE=CELL'...) """
+        if field.startswith("TEL;"):
+            for phone_field, number in self.phones:
+                if phone_field == field:
+                    return number
+            return default
+        return getattr(self, field, default) if field in self.__slots__ else default
+
+    def has(self, field):
+        return bool(self.get(field))
+
+class CardRef(object):
+    """A lazily loaded contact: only what finding it takes, its uid and the
+    verb fields it has (a tuple shared by the contacts having the same ones -
+    e.g. ("name", "mail", "TEL;TYPE=CELL")), and where its card is in its
+    CardFile, read back as a Contact when it is acted on. Its name is in the
+    index, not kept here, so none of the parsed contact is kept"""
+    __slots__ = ("uid", "fields", "card_file", "offset", "length")
+
+    def __init__(self, uid, fields, card_file, offset, length):
+        self.uid = uid
+        self.fields = fields
+        self.card_file = card_file
+        self.offset = offset
+        self.length = length
+
+    def __reduce__(self):
+        return (CardRef, (self.uid, self.fields, self.card_file, self.offset, self.length))
+
+    def __repr__(self):
+        return f"CardRef({self.uid!r}, {self.fields!r}, {self.offset!r}, {self.length!r})"
+
+    def has(self, field):
+        return field in self.fields
+
+    def read(self):
+        """ Returns the Contact of the card, None if its file changed """
+        return self.card_file.read(self)
+
+class PrefixTrie(object):
+    """Compact prefix index over the words of contact names.
+
+    The trie is kept implicit over a sorted word list: the words sharing a
+    prefix form one contiguous range, located with two binary searches.
+    Every word carries its contact number postings and every node whose
+    range is larger than LEAF_WORDS keeps its TOP_N first postings, so a
+    completion never walks more than LEAF_WORDS postings lists. Without
+    tops, completions walk the postings of all the words of the prefix"""
+    TOP_N = 32
+    LEAF_WORDS = 16
+
+    def __init__(self, words, tops=True):
+        postings = {}
+        for word, idx in words:
+            posting = postings.setdefault(word, [])
+            if not posting or posting[-1] != idx:
+                posting.append(idx)
+
+        self.words = sorted(postings)
+        self.postings = [tuple(postings[word]) for word in self.words]
+        self.tops = {}
+        if self.words and tops:
+            self._build_tops(0, 0, len(self.words))
+
+    def __len__(self):
+        return len(self.words)
+
+    def _merge(self, postings):
+        top = []
+        for idx in heapq.merge(*postings):
+            if not top or top[-1] != idx:
+                top.append(idx)
+                if len(top) == self.TOP_N:
+                    break
+        return tuple(top)
+
+    def _range(self, prefix, lo=0, hi=None):
+        hi = len(self.words) if hi is None else hi
+        lo = bisect_left(self.words, prefix, lo, hi)
+        return lo, bisect_left(self.words, prefix + "\U0010ffff", lo, hi)
+
+    def _build_tops(self, depth, lo, hi):
+        if hi - lo <= self.LEAF_WORDS:
+            return self._merge(self.postings[lo:hi])
+
+        prefix = self.words[lo][:depth]
+        parts = []
+        if len(self.words[lo]) == depth:
+            parts.append(self.postings[lo])
+            lo += 1
+        while lo < hi:
+            child_lo, child_hi = self._range(self.words[lo][:depth + 1], lo, hi)
+            parts.append(self._build_tops(depth + 1, child_lo, child_hi))
+            lo = child_hi
+
+        top = self._merge(parts)
+        self.tops[prefix] = top
+        return top
+
+    def has_word(self, word):
+        pos = bisect_left(self.words, word)
+        return pos < len(self.words) and self.words[pos] == word
+
+    def postings_of(self, word):
+        """ Returns the contact numbers of a word """
+        pos = bisect_left(self.words, word)
+        return self.postings[pos] if pos < len(self.words) and self.words[pos] == word else ()
+
+    def complete(self, prefix, limit=TOP_N):
+        """ Returns up to limit (at most TOP_N) contact numbers, in file order,
+        having a word starting with prefix """
+        if prefix is None:
+            raise ValueError('Requires not-Null prefix')
+
+        top = self.tops.get(prefix)
+        if top is None:
+            lo, hi = self._range(prefix)
+            top = self._merge(self.postings[lo:hi])
+        return top[:limit]
+
+    def completions(self, prefix):
+        """ Yields, in file order, all the contact numbers having a word
+        starting with prefix: the TOP_N first ones from complete, the next
+        ones merging the postings of the words only if they are asked for """
+        top = self.complete(prefix)
+        yield from top
+        if len(top) < self.TOP_N:
+            return
+        lo, hi = self._range(prefix)
+        last = top[-1]
+        for idx in heapq.merge(*self.postings[lo:hi]):
+            if idx > last:
+                last = idx
+                yield idx
+
+class TopK(object):
+    """Bounded heap keeping the k best (lowest) scored contact numbers, ties
+    going to the lower contact number (file order)"""
+
+    def __init__(self, k):
+        self.k = k
+        self.heap = []
+
+    def push(self, score, idx):
+        item = (-score, -idx)
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, item)
+        elif item > self.heap[0]:
+            heapq.heapreplace(self.heap, item)
+
+    def full(self):
+        return len(self.heap) >= self.k
+
+    def worst(self):
+        return -self.heap[0][0]
+
+    def items(self):
+        return sorted((-score, -idx) for score, idx in self.heap)
+
+PHONE_DIGITS = re.compile(r"\D")
+PHONE_PUNCTUATION = str.maketrans("", "", " ()-+./")
+
+def phone_digits(number):
+    """ Returns the digits of a phone number, E.164 style: no punctuation and
+    no 00 international call prefix before the country code """
+    digits = number.translate(PHONE_PUNCTUATION)
+    if not digits.isdigit():
+        digits = PHONE_DIGITS.sub("", digits)
+    return digits[2:] if digits.startswith("00") else digits
+
+def phone_key(number):
+    """ Returns the last ten digits of a phone number, which is enough to
+    tell numbers apart whatever their format or country prefix """
+    digits = phone_digits(number)
+    return digits[-10:] if len(digits) >= 7 else None
+
+# Latin letters NFKD does not decompose into a base letter and accents
+LATIN_FOLDING = str.maketrans({"ø": "o", "æ": "ae", "œ": "oe", "ł": "l", "đ": "d", "ð": "d", "þ": "th", "ı": "i"})
+# Greek, Cyrillic and Hebrew letters (casefolded, without accents or points)
+# spelled with Latin ones, Hebrew without its unwritten vowels
+TRANSLITERATION = str.maketrans({
+    "α": "a", "β": "v", "γ": "g", "δ": "d", "ε": "e", "ζ": "z", "η": "i", "θ": "th", "ι": "i", "κ": "k",
+    "λ": "l", "μ": "m", "ν": "n", "ξ": "x", "ο": "o", "π": "p", "ρ": "r", "σ": "s", "ς": "s", "τ": "t",
+    "υ": "y", "φ": "f", "χ": "ch", "ψ": "ps", "ω": "o",
+    "а": "a", "б": "b", "в": "v", "г": "g", "ґ": "g", "д": "d", "е": "e", "є": "ye", "ж": "zh", "з": "z",
+    "и": "i", "і": "i", "к": "k", "л": "l", "м": "m", "н": "n", "о": "o", "п": "p", "р": "r", "с": "s",
+    "т": "t", "у": "u", "ф": "f", "х": "kh", "ц": "ts", "ч": "ch", "ш": "sh", "щ": "shch", "ъ": "",
+    "ы": "y", "ь": "", "э": "e", "ю": "yu", "я": "ya",
+    "א": "a", "ב": "b", "ג": "g", "ד": "d", "ה": "h", "ו": "v", "ז": "z", "ח": "h", "ט": "t", "י": "y",
+    "כ": "k", "ך": "k", "ל": "l", "מ": "m", "ם": "m", "נ": "n", "ן": "n", "ס": "s", "ע": "", "פ": "p",
+    "ף": "p", "צ": "ts", "ץ": "ts", "ק": "k", "ר": "r", "ש": "sh", "ת": "t"})
+
+def fold_name(name):
+    """ Returns the name without case or accents, with single spaces """
+    if name.isascii():
+        return " ".join(name.lower().split())
+    name = unicodedata.normalize("NFKD", name.casefold())
+    name = "".join(c for c in name if not unicodedata.combining(c)).translate(LATIN_FOLDING)
+    return " ".join(name.split())
+
+def search_key(text, transliterate=False):
+    """ Returns the text as it is searched, folded (see fold_name) and with
+    transliterate, its Greek, Cyrillic and Hebrew letters spelled in Latin.
+    Contacts are indexed by the keys of their fields and queries looked up by
+    theirs, so "jose" finds "José" without folding the contacts per query """
+    key = fold_name(text)
+    if transliterate and not key.isascii():
+        key = key.translate(TRANSLITERATION)
+    return key
+
+class FieldIndex(object):
+    """Inverted index of the words of the contact fields: every word maps to
+    its postings, contact number * FIELD_SLOTS + field number. A query
+    matches the contacts having all its words, its last word as a prefix, in
+    any field and scores them by the weight of the fields they match in, so
+    its cost depends on the postings of its words only.
+
+    The postings of all the words are kept in a single array, those of the
+    word at position i from starts[i] to starts[i + 1]"""
+    FIELDS = ("name", "nickname", "mail", "title", "org", "note")
+    FIELD_SLOTS = 8
+    WORDS = re.compile(r"\w+")
+    MIN_PREFIX = 2
+    # Postings scanned for the cost of a seek in them
+    SEEK_COST = 4
+
+    def __init__(self, fields, transliterate=False):
+        postings = {}
+        field_numbers = {field: number for number, field in enumerate(self.FIELDS)}
+        # Titles and organizations repeat, split them once
+        text_words = {}
+        for idx, contact_fields in enumerate(fields):
+            # In field order, for sorted postings
+            for number, text in sorted((field_numbers[field], text) for field, text in contact_fields):
+                code = idx * self.FIELD_SLOTS + number
+                words = text_words.get(text)
+                if words is None:
+                    words = text_words[text] = set(self.WORDS.findall(search_key(text, transliterate)))
+                for word in words:
+                    posting = postings.get(word)
+                    if posting is None:
+                        postings[word] = [code]
+                    elif posting[-1] != code:
+                        posting.append(code)
+
+        self.words = sorted(postings)
+        self.codes = array("I")
+        self.starts = array("I", [0])
+        for word in self.words:
+            self.codes.extend(postings[word])
+            self.starts.append(len(self.codes))
+
+    def __len__(self):
+        return len(self.words)
+
+    def word_postings(self, word, prefix):
+        """ Returns the (start, end) postings of a word, or of the words it is
+        a prefix of """
+        lo = bisect_left(self.words, word)
+        if not prefix or len(word) < self.MIN_PREFIX:
+            hi = lo + 1 if lo < len(self.words) and self.words[lo] == word else lo
+        else:
+            hi = bisect_left(self.words, word + "\U0010ffff", lo)
+        return [(self.starts[i], self.starts[i + 1]) for i in range(lo, hi)]
+
+    def search(self, query, weights):
+        """ Returns the contact number -> score of the contacts matching the
+        query (a search_key), weights being the weight of each field """
+        words = self.WORDS.findall(query)
+        if not words:
+            return {}
+        # The words with the shortest postings narrow the matches first
+        word_postings = []
+        for i, word in enumerate(words):
+            postings = self.word_postings(word, i == len(words) - 1)
+            word_postings.append((sum(end - start for start, end in postings), postings))
+        word_postings.sort()
+
+        codes = self.codes
+        scores = None
+        for size, postings in word_postings:
+            word_scores = {}
+            if scores is not None and len(scores) * len(postings) * self.SEEK_COST < size:
+                # Seek the few matches so far in long postings rather than scan them
+                for start, end in postings:
+                    for idx in scores:
+                        first = idx * self.FIELD_SLOTS
+                        lo = bisect_left(codes, first, start, end)
+                        for i in range(lo, bisect_left(codes, first + self.FIELD_SLOTS, lo, end)):
+                            weight = weights[codes[i] - first]
+                            if weight > word_scores.get(idx, 0):
+                                word_scores[idx] = weight
+            else:
+                for start, end in postings:
+                    for code in codes[start:end]:
+                        idx, field = divmod(code, self.FIELD_SLOTS)
+                        weight = weights[field]
+                        if weight > word_scores.get(idx, 0) and (scores is None or idx in scores):
+                            word_scores[idx] = weight
+            if scores is not None:
+                word_scores = {idx: score + scores[idx] for idx, score in word_scores.items()}
+            scores = word_scores
+            if not scores:
+                break
+        return scores
+
+class ContactIndex(object):
+    """Name index built once per load so that a query only touches candidate
+    postings: prefix tries over first/last names and over the other words
+    (middle names, nicknames), initials, exact names and character trigrams
+    of the full name map to contact numbers, and its single characters and
+    character pairs (short grams) too, for the queries too short for
+    trigrams. Phone numbers are indexed by
+    their reversed digits, so that any trailing digits find them, and all
+    the text fields by a FieldIndex ranked after the name matches. Names and
+    fields are indexed by their search_key, with transliterate if set, which
+    queries must be normalized to"""
+    NGRAM = 3
+    MIN_PHONE_DIGITS = 4
+
+    # Match ranks, best first
+    RANK_EXACT = 0
+    RANK_NAME_PREFIX = 1
+    RANK_WORD_BOUNDARY = 2
+    RANK_INITIALS = 3
+    RANK_SUBSTRING = 4
+    RANK_FIELDS = 5
+
+    def __init__(self, names, phones=(), fields=(), transliterate=False):
+        self.transliterate = transliterate
+        self.keys = []
+        self.nicknames = {}
+        self.exact = {}
+        self.initials = {}
+        self.trigrams = {}
+        short_grams = {}
+        name_words = []
+        other_words = []
+
+        for idx, (name, nickname) in enumerate(names):
+            key = search_key(name, transliterate) if name else ""
+            self.keys.append(key)
+            words = key.split()
+            if words:
+                self.exact.setdefault(key, []).append(idx)
+                name_words.append((words[0], idx))
+                if len(words) > 1:
+                    name_words.append((words[-1], idx))
+                    # Initials prefixes keep matches monotonic as a query grows
+                    initials = "".join(word[0] for word in words)
+                    prefixes = {initials[:i] for i in range(2, len(initials) + 1)}
+                    for initials in prefixes | {words[0][0] + words[-1][0]}:
+                        self.initials.setdefault(initials, []).append(idx)
+                other_words.extend((word, idx) for word in words[1:-1])
+            if nickname:
+                nickname = self.nicknames[idx] = search_key(nickname, transliterate)
+                other_words.extend((word, idx) for word in nickname.split())
+            for gram in {key[i:i+self.NGRAM] for i in range(len(key) - self.NGRAM + 1)}:
+                self.trigrams.setdefault(gram, []).append(idx)
+            for gram in {key[i:i+size] for size in range(1, self.NGRAM) for i in range(len(key) - size + 1)}:
+                short_grams.setdefault(gram, []).append(idx)
+
+        # Most contacts hold the common short grams, keep their postings compact
+        self.short_grams = {gram: array("I", posting) for gram, posting in short_grams.items()}
+        self.name_trie = PrefixTrie(name_words)
+        self.word_trie = PrefixTrie(other_words)
+        phone_words = ((digits[::-1], idx)
+            for idx, numbers in enumerate(phones)
+            for digits in map(phone_digits, numbers) if len(digits) >= self.MIN_PHONE_DIGITS)
+        # Few numbers share MIN_PHONE_DIGITS trailing digits, completions stay short
+        self.phone_trie = PrefixTrie(phone_words, tops=False)
+        self.fields = FieldIndex(fields, transliterate)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def rank(self, query, idx):
+        """ Returns the match rank of a contact for a query (a search_key),
+        None if it does not match """
+        return self.key_rank(query, self.keys[idx], self.nicknames.get(idx, ""))
+
+    @classmethod
+    def key_rank(cls, query, key, nickname):
+        """ Returns the match rank of a query for a name and nickname keys """
+        if key == query:
+            return cls.RANK_EXACT
+        words = key.split()
+        if not words:
+            return None
+        if key.startswith(query) or words[-1].startswith(query):
+            return cls.RANK_NAME_PREFIX
+        if (" " + key).find(" " + query) >= 0 or (" " + nickname).find(" " + query) >= 0:
+            return cls.RANK_WORD_BOUNDARY
+        if len(words) > 1 and len(query) > 1 and (
+                query == words[0][0] + words[-1][0] or "".join(word[0] for word in words).startswith(query)):
+            return cls.RANK_INITIALS
+        if query in key:
+            return cls.RANK_SUBSTRING
+        return None
+
+    def substring_candidates(self, query):
+        """ Returns contact numbers, in file order, which may contain the query """
+        if len(query) < self.NGRAM:
+            # The contacts holding the query, a short gram
+            return self.short_grams.get(query, ())
+
+        # Every match holds every query trigram - the rarest posting will do
+        postings = []
+        for i in range(len(query) - self.NGRAM + 1):
+            posting = self.trigrams.get(query[i:i+self.NGRAM])
+            if not posting:
+                return ()
+            postings.append(posting)
+        return min(postings, key=len)
+
+    @classmethod
+    def phone_query(cls, query):
+        """ Returns the digits of a query made of phone number digits (and
+        punctuation), None for other queries """
+        digits = query.translate(PHONE_PUNCTUATION)
+        if len(digits) < cls.MIN_PHONE_DIGITS or not digits.isdigit():
+            return None
+        return phone_digits(query)
+
+    def search_phone(self, digits, limit, accept=None):
+        """ Returns the (rank, contact number) of up to limit contacts with a
+        phone number ending with the digits, whole numbers first """
+        reversed_digits = digits[::-1]
+        exact = self.phone_trie.postings_of(reversed_digits)
+        top = TopK(limit)
+        for idx in exact:
+            if accept is None or accept(idx):
+                top.push(self.RANK_EXACT, idx)
+        # The completions come in file order and rank alike: once the top is
+        # full, the next ones lose the tie
+        exact = set(exact)
+        for idx in self.phone_trie.completions(reversed_digits):
+            if top.full() and top.worst() <= self.RANK_NAME_PREFIX:
+                break
+            if idx not in exact and (accept is None or accept(idx)):
+                top.push(self.RANK_NAME_PREFIX, idx)
+        return top.items()
+
+    def search(self, query, limit, accept=None, candidates=None, weights=None):
+        """ Returns the (rank, contact number) of the best limit matches of the
+        query (a search_key), best first, and the contact numbers of all the
+        matches, or None if the search stopped early. accept(contact number)
+        may reject contacts (e.g. with no phone for the Cell verb), candidates
+        restricts the search to the matches of a shorter query and weights,
+        the FieldIndex.FIELDS weights, also match the other fields """
+        digits = self.phone_query(query)
+        if digits:
+            return self.search_phone(digits, limit, accept), None
+
+        top = TopK(limit)
+        matched = []
+        seen = set()
+
+        def consider(candidates, stop_rank=None):
+            # The candidates come in file order and, but for the seen ones,
+            # rank stop_rank or worse: once the top holds limit contacts
+            # ranked stop_rank or better, the next ones lose the tie. Returns
+            # False if it stopped there
+            for idx in candidates:
+                if stop_rank is not None and top.full() and top.worst() <= stop_rank:
+                    return False
+                if idx in seen:
+                    continue
+                seen.add(idx)
+                rank = self.rank(query, idx)
+                if rank is not None and (accept is None or accept(idx)):
+                    top.push(rank, idx)
+                    matched.append(idx)
+            return True
+
+        def consider_fields():
+            # The field matches rank after the name ones. They are searched
+            # again for every query, not kept in matched, so only the best
+            # scored ones need to be accepted. The contacts seen but whose
+            # name did not match may match by their fields, whether they
+            # were candidates or not
+            if not weights or not any(weights):
+                return
+            named = set(matched)
+            scores = self.fields.search(query, weights)
+            # Sorting ints, not tuples, spares the collector passes of many new objects
+            for idx in sorted(sorted(scores), key=scores.__getitem__, reverse=True):
+                rank = self.RANK_FIELDS + 1 / (1 + scores[idx])
+                if top.full() and rank >= top.worst():
+                    break
+                if idx not in named and (accept is None or accept(idx)):
+                    top.push(rank, idx)
+
+        if candidates is not None:
+            consider(candidates)
+            consider_fields()
+            return top.items(), matched
+
+        # The completions are pulled only as long as the top can improve, as
+        # few as accept lets through
+        consider(self.exact.get(query, ()))
+        if not " " in query:
+            if not consider(self.name_trie.completions(query), self.RANK_NAME_PREFIX):
+                return top.items(), None
+            if not consider(self.word_trie.completions(query), self.RANK_WORD_BOUNDARY):
+                return top.items(), None
+            consider(self.initials.get(query, ()))
+        if not consider(self.substring_candidates(query), self.RANK_SUBSTRING):
+            return top.items(), None
+        consider_fields()
+        return top.items(), sorted(matched)
+
+class SegmentedIndex(object):
+    """One ContactIndex segment per contacts file, searched as a single index
+    over the concatenated contacts so that reloading a file only re-indexes
+    its own segment"""
+
+    def __init__(self, indexes):
+        self.segments = []
+        offset = 0
+        for index in indexes:
+            self.segments.append((offset, index))
+            offset += len(index)
+
+    def rank(self, query, idx):
+        """ Returns the match rank of a contact for a (normalized) query """
+        for offset, index in self.segments:
+            if idx < offset + len(index):
+                return index.rank(query, idx - offset)
+        return None
+
+    @staticmethod
+    def normalize(query, transliterate=False):
+        """ Returns the search_key of a query, once per query for all the
+        segments """
+        return search_key(query, transliterate)
+
+    def search(self, query, limit, accept=None, candidates=None, weights=None, fields=None):
+        """ Returns the numbers of the best limit contacts matching the
+        (normalized) query and the sorted numbers of all the matching contacts,
+        or None if the search stopped early. candidates, sorted, restricts the
+        search to the matches of a shorter query, weights match the other
+        fields (see ContactIndex.search). fields, the verb fields accept
+        requires one of, is for the indexes which filter them themselves
+        (SqliteIndex) """
+        if not query:
+            return [], None
+
+        matches = []
+        matched = []
+        for offset, index in self.segments:
+            segment_accept = (lambda idx, offset=offset: accept(offset + idx)) if accept else None
+            segment_candidates = None
+            if candidates is not None:
+                start = bisect_left(candidates, offset)
+                end = bisect_left(candidates, offset + len(index), start)
+                segment_candidates = [idx - offset for idx in candidates[start:end]]
+            found, segment_matched = index.search(query, limit, segment_accept, segment_candidates, weights)
+            matches.extend((rank, offset + idx) for rank, idx in found)
+            if matched is not None and segment_matched is not None:
+                matched.extend(offset + idx for idx in segment_matched)
+            else:
+                matched = None
+        return [idx for _, idx in heapq.nsmallest(limit, matches)], matched
+
+class QueryCache(object):
+    """Least recently used queries of a verb and the numbers of all their
+    matching contacts: typing only narrows the matches, so a query that
+    extends a cached one only has to filter its matches"""
+    SIZE = 8
+
+    def __init__(self):
+        self.queries = OrderedDict()
+
+    def candidates(self, query):
+        """ Returns the cached matches of the longest cached prefix of the
+        query, None if there is none """
+        prefix = max((cached for cached in self.queries if query.startswith(cached)), key=len, default=None)
+        if prefix is None:
+            return None
+        self.queries.move_to_end(prefix)
+        return self.queries[prefix]
+
+    def add(self, query, matched):
+        self.queries[query] = matched
+        self.queries.move_to_end(query)
+        while len(self.queries) > self.SIZE:
+            self.queries.popitem(last=False)
+
+def merge_keys(contacts):
+    """ Returns the keys identifying each contact across files: its
+    normalized emails and its folded name with each of its phone numbers """
+    keys = []
+    for contact in contacts:
+        contact_keys = [mail.strip().lower() for mail in contact.alt_mails]
+        if contact.mail:
+            contact_keys.append(contact.mail.strip().lower())
+        if contact.phones:
+            name = fold_name(contact.name)
+            for _, number in contact.phones:
+                key = phone_key(number)
+                if key:
+                    contact_keys.append((name, key))
+        keys.append(contact_keys)
+    return keys
+
+def merged_contact(members, sources):
+    """ Returns one contact holding the phones and emails of all members,
+    named after the first. A number is kept once per field it is given in
+    (a Home number of one file stays a Home number when another file has it
+    as Cell) and an email once, both compared as merge_keys does """
+    first = members[0]
+    phones = []
+    phone_keys = set()
+    mails = []
+    mail_keys = set()
+    for member in members:
+        for field, number in member.phones:
+            key = (field, phone_key(number) or number)
+            if key not in phone_keys:
+                phone_keys.add(key)
+                phones.append((field, number))
+        for mail in (member.mail,) + member.alt_mails:
+            key = mail.strip().lower()
+            if key and key not in mail_keys:
+                mail_keys.add(key)
+                mails.append(mail)
+    mail = mails[0] if mails else ""
+    return Contact(first.name, mail,
+        first.description or next((member.description for member in members if member.description), ""),
+        first.nickname or next((member.nickname for member in members if member.nickname), ""),
+        tuple(phones), first.uid, tuple(mails[1:]), tuple(dict.fromkeys(sources)),
+        tuple(dict.fromkeys(detail for member in members for detail in member.details)))
+
+class ContactSet(object):
+    """Snapshot of the loaded contacts files: the file name -> (fingerprint,
+    contacts, index) segments, the concatenated contacts and their index.
+    A load builds a new snapshot and swaps it in as a whole.
+
+    A file's journal follows it as a file of its own, whose contacts replace
+    the contacts of the file with the same uid, or delete them when nameless.
+    The replaced contacts stay in their segment but are hidden.
+
+    With merge, contacts of different files sharing an email, or a name and
+    a phone number, are merged into the first of them: every one of their
+    positions holds the merged contact and merged_into maps the others to
+    the first. The merge keys of a file are kept from the previous snapshot
+    while the file is unchanged.
+
+    The contacts of lazily loaded files are CardRefs, read back as contacts
+    by contact(), which keeps the last CARDS read"""
+    CARDS = 64
+
+    def __init__(self, files=None, previous=None, merge=False):
+        self.files = files if files else {}
+        self.contacts = [contact for _, contacts, _ in self.files.values() for contact in contacts]
+        self.index = SegmentedIndex([index for _, _, index in self.files.values()])
+        self.ids = {contact.uid: idx for idx, contact in enumerate(self.contacts)}
+        # Only journals repeat uids
+        self.hidden = self.replaced_contacts() if len(self.ids) < len(self.contacts) else set()
+        self.merge = merge
+        self.merge_keys = {}
+        self.merged_into = {}
+        self.cards = OrderedDict()
+        if merge and len(set(map(self.source_name, self.files))) > 1:
+            with paused_gc():
+                self.merge_files(previous)
+        self.query_caches = {}
+        self.payloads = {}
+        self.action_payloads = {}
+
+    @staticmethod
+    def source_name(filename):
+        """ Returns the name of the file a file (or its journal) stands for """
+        return filename[:-len(VcfFile.JOURNAL_SUFFIX)] if filename.endswith(VcfFile.JOURNAL_SUFFIX) else filename
+
+    def replaced_contacts(self):
+        """ Returns the numbers of the contacts replaced by a later one with
+        the same uid and of the nameless ones deleting them, whose uids are
+        dropped """
+        hidden = set()
+        deleted = set()
+        for idx, contact in enumerate(self.contacts):
+            latest = self.ids[contact.uid]
+            if latest != idx:
+                hidden.add(idx)
+                if not self.contacts[latest].has("name"):
+                    deleted.add(latest)
+        for idx in deleted:
+            hidden.add(idx)
+            del self.ids[self.contacts[idx].uid]
+        return hidden
+
+    def merge_files(self, previous):
+        # Contacts are joined through hash indexes of their keys, in one pass,
+        # a journal's contacts being of the same file as the file's
+        owners = {}
+        parent = {}
+        hidden = self.hidden
+        source_numbers = {}
+
+        def find(idx):
+            while idx in parent:
+                idx = parent[idx]
+            return idx
+
+        starts = []
+        offset = 0
+        for filename, (_, contacts, _) in self.files.items():
+            file_no = source_numbers.setdefault(self.source_name(filename), len(source_numbers))
+            starts.append(offset)
+            keys = None
+            if previous is not None and filename in previous.merge_keys and previous.files[filename][1] is contacts:
+                keys = previous.merge_keys[filename]
+            if keys is None:
+                keys = merge_keys(CardFile.contacts_of(contacts))
+            self.merge_keys[filename] = keys
+            for idx, contact_keys in enumerate(keys, offset):
+                if hidden and idx in hidden:
+                    continue
+                for key in contact_keys:
+                    owner_file_no, owner = owners.setdefault(key, (file_no, idx))
+                    if owner_file_no != file_no:
+                        root, other = find(owner), find(idx)
+                        if root != other:
+                            parent[max(root, other)] = min(root, other)
+            offset += len(contacts)
+
+        groups = {}
+        for idx in parent:
+            groups.setdefault(find(idx), []).append(idx)
+        filenames = [self.source_name(filename) for filename in self.files]
+        for first, others in groups.items():
+            members = [first] + sorted(others)
+            member_contacts = [self.contact(idx, cache=False) for idx in members]
+            if None in member_contacts:
+                continue
+            merged = merged_contact(member_contacts, [filenames[bisect_right(starts, idx) - 1] for idx in members])
+            for idx in others:
+                self.ids[self.contacts[idx].uid] = first
+                self.merged_into[idx] = first
+            for idx in members:
+                self.contacts[idx] = merged
+
+    def canonical(self, matches):
+        """ Returns the contact numbers with merged ones replaced by the number
+        of the contact they merged into, without repeats """
+        if not self.merged_into:
+            return matches
+        canonical = []
+        for idx in matches:
+            idx = self.merged_into.get(idx, idx)
+            if idx not in canonical:
+                canonical.append(idx)
+        return canonical
+
+    def contact(self, idx, cache=True):
+        """ Returns the contact at a position, read back from its file if
+        loaded lazily, None if the file changed since """
+        contact = self.contacts[idx]
+        if not isinstance(contact, CardRef):
+            return contact
+        cards = self.cards
+        card = cards.get(idx)
+        if card is not None:
+            cards.move_to_end(idx)
+            return card
+        card = contact.read()
+        if card is not None and cache:
+            cards[idx] = card
+            if len(cards) > self.CARDS:
+                cards.popitem(last=False)
+        return card
+
+    def position(self, uid):
+        """ Returns the position of the contact with the given uid, None if it is gone """
+        return self.ids.get(uid)
+
+    def get(self, uid):
+        """ Returns the contact with the given uid, None if it is gone """
+        idx = self.position(uid)
+        return self.contact(idx) if idx is not None else None
+
+    def size(self):
+        """ Returns the number of contacts, those hidden by journals aside """
+        return len(self.contacts) - len(self.hidden)
+
+    def query_cache(self, verb_name):
+        """ Returns the query cache of a verb, which lives as long as this snapshot """
+        return self.query_caches.setdefault(verb_name, QueryCache())
+
+class SqliteStore(object):
+    """Contacts kept in a SQLite database rather than in memory, for very
+    large directories. A vCard file is ingested, in a transaction, only when
+    its fingerprint changes, so loading unchanged files costs nothing
+    whatever their size. A contact is a row of its uid, verb fields and
+    pickled Contact, and an FTS5 row of the search keys of its name,
+    nickname, emails, titles, organizations, notes and phone digits, also
+    reversed so that trailing digits are a prefix, and of its last name.
+    Searches filter the contacts by the verb fields in SQL and read no more
+    rows than they need. A journal's rows hide the
+    rows of its file with the same uid, as in ContactSet.
+
+    SQLite connections are per thread: the loader writes while the
+    suggestions read, each with its own"""
+    SCHEMA_VERSION = 3
+    TEXT_COLUMNS = ("name", "nickname", "mail", "title", "org", "note", "phones", "tails", "last")
+    INGEST_BATCH = 10000
+
+    def __init__(self, path, transliterate=False):
+        self.path = path
+        self.transliterate = transliterate
+        self.local = threading.local()
+        self.fields = {}
+        self.open()
+
+    def connection(self):
+        db = getattr(self.local, "db", None)
+        if db is None:
+            db = self.local.db = sqlite3.connect(self.path, timeout=30)
+        return db
+
+    def open(self):
+        """ Creates the database, or empties it if made with other settings.
+        Raises sqlite3.Error, e.g. if SQLite was built without FTS5 """
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        db = self.connection()
+        db.execute("PRAGMA journal_mode = WAL")
+        db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        settings = json.dumps([self.SCHEMA_VERSION, self.transliterate])
+        row = db.execute("SELECT value FROM meta WHERE key = 'settings'").fetchone()
+        if row is None or row[0] != settings:
+            db.executescript("DROP TABLE IF EXISTS files; DROP TABLE IF EXISTS contacts; "
+                "DROP TABLE IF EXISTS contact_text;")
+        db.executescript(f"""
+            CREATE TABLE IF NOT EXISTS files (name TEXT PRIMARY KEY, fingerprint TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS contacts (id INTEGER PRIMARY KEY AUTOINCREMENT, file TEXT NOT NULL,
+                uid TEXT NOT NULL, key TEXT NOT NULL, fields TEXT NOT NULL, hidden INTEGER NOT NULL DEFAULT 0,
+                card BLOB NOT NULL);
+            CREATE INDEX IF NOT EXISTS contacts_file ON contacts (file);
+            CREATE INDEX IF NOT EXISTS contacts_uid ON contacts (uid);
+            CREATE INDEX IF NOT EXISTS contacts_key ON contacts (key);
+            CREATE INDEX IF NOT EXISTS contacts_hidden ON contacts (hidden) WHERE hidden;
+            CREATE VIRTUAL TABLE IF NOT EXISTS contact_text USING fts5({", ".join(self.TEXT_COLUMNS)},
+                prefix='1 2 3');
+            """)
+        with db:
+            db.execute("INSERT OR REPLACE INTO meta VALUES ('settings', ?)", (settings,))
+
+    def fingerprints(self):
+        """ Returns the file name -> fingerprint of the ingested files """
+        return {name: tuple(json.loads(fingerprint))
+            for name, fingerprint in self.connection().execute("SELECT name, fingerprint FROM files")}
+
+    def text_row(self, idx, contact):
+        """ Returns the FTS5 row of a contact: the search keys of its fields """
+        transliterate = self.transliterate
+        fields = {}
+        for field, text in Ppl.contact_fields(contact):
+            fields.setdefault(field, []).append(search_key(text, transliterate))
+        digits = [phone_digits(number) for _, number in contact.phones]
+        digits = [number for number in digits if len(number) >= ContactIndex.MIN_PHONE_DIGITS]
+        name = fields.get("name", [""])[0]
+        return (idx, name, " ".join(fields.get("nickname", ())),
+            " ".join(fields.get("mail", ())), " ".join(fields.get("title", ())), " ".join(fields.get("org", ())),
+            " ".join(fields.get("note", ())), " ".join(digits), " ".join(number[::-1] for number in digits),
+            name.split()[-1] if name else "")
+
+    def ingest(self, filename, fingerprint, contacts):
+        """ Replaces the contacts of a file, in one transaction. The contacts
+        may come from an iterator, they are inserted INGEST_BATCH at a time so
+        that no more are in memory. Returns the number of contacts """
+        db = self.connection()
+        with db:
+            self.delete_file(db, filename)
+            row = db.execute("SELECT seq FROM sqlite_sequence WHERE name = 'contacts'").fetchone()
+            start = (row[0] if row else 0) + 1
+            count = 0
+            rows = []
+            text_rows = []
+            for idx, contact in enumerate(contacts, start):
+                key = search_key(contact.name, self.transliterate) if contact.name else ""
+                rows.append((idx, filename, contact.uid, key, "\t".join(verb_fields(contact)),
+                    pickle.dumps(contact, protocol=pickle.HIGHEST_PROTOCOL)))
+                text_rows.append(self.text_row(idx, contact))
+                if len(rows) == self.INGEST_BATCH:
+                    count += self.insert(db, rows, text_rows)
+                    rows, text_rows = [], []
+            count += self.insert(db, rows, text_rows)
+            db.execute("INSERT INTO files VALUES (?, ?)", (filename, json.dumps(fingerprint)))
+            self.hide_replaced(db)
+        return count
+
+    def insert(self, db, rows, text_rows):
+        db.executemany("INSERT INTO contacts (id, file, uid, key, fields, card) VALUES (?, ?, ?, ?, ?, ?)", rows)
+        db.executemany(f"INSERT INTO contact_text (rowid, {', '.join(self.TEXT_COLUMNS)}) "
+            f"VALUES ({', '.join('?' * (len(self.TEXT_COLUMNS) + 1))})", text_rows)
+        return len(rows)
+
+    def update_fingerprint(self, filename, fingerprint):
+        """ Records the new fingerprint of a file whose content did not change """
+        db = self.connection()
+        with db:
+            db.execute("UPDATE files SET fingerprint = ? WHERE name = ?", (json.dumps(fingerprint), filename))
+
+    def remove(self, filenames):
+        """ Removes the contacts of files, in one transaction """
+        db = self.connection()
+        with db:
+            for filename in filenames:
+                self.delete_file(db, filename)
+            self.hide_replaced(db)
+
+    @staticmethod
+    def delete_file(db, filename):
+        db.execute("DELETE FROM contact_text WHERE rowid IN (SELECT id FROM contacts WHERE file = ?)", (filename,))
+        db.execute("DELETE FROM contacts WHERE file = ?", (filename,))
+        db.execute("DELETE FROM files WHERE name = ?", (filename,))
+
+    @staticmethod
+    def hide_replaced(db):
+        """ Hides the contacts replaced by a later one with the same uid, that
+        is by one of their file's journal, and the nameless ones deleting them """
+        db.execute("UPDATE contacts SET hidden = 0 WHERE hidden")
+        latest = {}
+        hidden = []
+        # A journal's contacts come after its file's, whatever their ids
+        for idx, uid, fields in db.execute("SELECT id, uid, fields FROM contacts WHERE uid IN "
+                "(SELECT uid FROM contacts WHERE file LIKE ?) ORDER BY file LIKE ?, id",
+                ("%" + VcfFile.JOURNAL_SUFFIX, "%" + VcfFile.JOURNAL_SUFFIX)):
+            if uid in latest:
+                hidden.append(latest[uid][0])
+            latest[uid] = (idx, fields)
+        hidden.extend(idx for idx, fields in latest.values() if "name" not in fields.split("\t"))
+        db.executemany("UPDATE contacts SET hidden = 1 WHERE id = ?", ((idx,) for idx in hidden))
+
+    def card_ref(self, idx, uid, fields):
+        fields = self.fields.get(fields) or self.fields.setdefault(fields, tuple(fields.split("\t")) if fields else ())
+        return CardRef(uid, fields, self, idx, 0)
+
+    def ref(self, idx):
+        """ Returns the CardRef of a row, without fields if it is gone """
+        row = self.connection().execute("SELECT uid, fields FROM contacts WHERE id = ?", (idx,)).fetchone()
+        return self.card_ref(idx, *row) if row else CardRef("", (), self, idx, 0)
+
+    def read(self, ref):
+        """ Returns the Contact of a CardRef, None if it is gone """
+        row = self.connection().execute("SELECT card FROM contacts WHERE id = ?", (ref.offset,)).fetchone()
+        if row is None:
+            return None
+        contact = pickle.loads(row[0])
+        contact.uid = ref.uid
+        return contact
+
+    def position(self, uid):
+        row = self.connection().execute("SELECT id FROM contacts WHERE uid = ? AND NOT hidden ORDER BY id DESC LIMIT 1",
+            (uid,)).fetchone()
+        return row[0] if row else None
+
+    def names(self, idx):
+        """ Returns the name and nickname keys of a row """
+        row = self.connection().execute("SELECT name, nickname FROM contact_text WHERE rowid = ?", (idx,)).fetchone()
+        return row if row else ("", "")
+
+    def count(self, hidden=False):
+        condition = "" if hidden else " WHERE NOT hidden"
+        return self.connection().execute(f"SELECT count(*) FROM contacts{condition}").fetchone()[0]
+
+    def exact(self, key, fields=None, limit=-1):
+        """ Yields the (id, uid, fields, name, nickname) of the first limit
+        rows named key (see verb_condition for fields) """
+        condition, params = self.verb_condition(fields)
+        return self.connection().execute("SELECT c.id, c.uid, c.fields, t.name, t.nickname FROM contacts c "
+            f"JOIN contact_text t ON t.rowid = c.id WHERE c.key = ? AND NOT c.hidden{condition} ORDER BY c.id "
+            "LIMIT ?", (key,) + params + (limit,))
+
+    def matches(self, match, fields=None, limit=-1):
+        """ Yields the (id, uid, fields, name, nickname) of the first limit
+        rows matching an FTS5 query, in id order (the order of the index,
+        which SQLite then needs not sort) """
+        condition, params = self.verb_condition(fields)
+        return self.connection().execute("SELECT c.id, c.uid, c.fields, t.name, t.nickname FROM contact_text t "
+            f"JOIN contacts c ON c.id = t.rowid WHERE contact_text MATCH ? AND NOT c.hidden{condition} "
+            "ORDER BY t.rowid LIMIT ?", (match,) + params + (limit,))
+
+    def phone_matches(self, match, fields=None, limit=-1):
+        """ Yields the (id, uid, fields, phones) of the first limit rows
+        matching an FTS5 query of their phones or tails """
+        condition, params = self.verb_condition(fields)
+        return self.connection().execute("SELECT c.id, c.uid, c.fields, t.phones FROM contact_text t "
+            f"JOIN contacts c ON c.id = t.rowid WHERE contact_text MATCH ? AND NOT c.hidden{condition} "
+            "ORDER BY t.rowid LIMIT ?", (match,) + params + (limit,))
+
+    @staticmethod
+    def verb_condition(fields):
+        """ Returns the SQL condition, and its parameters, of the contacts
+        having one of the verb fields (e.g. those a verb acts on), all of
+        them if fields is None """
+        if fields is None:
+            return "", ()
+        if not fields:
+            return " AND 0", ()
+        return " AND (" + " OR ".join(["instr(char(9) || c.fields || char(9), ?)"] * len(fields)) + ")", \
+            tuple(f"\t{field}\t" for field in fields)
+
+class SqliteContacts(object):
+    """The contacts of a SqliteStore, CardRefs by row id. Those of the rows
+    found by the last search are kept, filtering them takes no query"""
+
+    def __init__(self, store):
+        self.store = store
+        self.refs = {}
+
+    def __len__(self):
+        return self.store.count(hidden=True)
+
+    def __getitem__(self, idx):
+        ref = self.refs.get(idx)
+        return ref if ref is not None else self.store.ref(idx)
+
+class SqliteIndex(object):
+    """Searches a SqliteStore as ContactIndex ranks: exact names first, then
+    the names starting with the query or whose last name does, then those
+    with its words in a row and with all its words (word prefixes, not
+    substrings or initials) and last, the contacts with the words in their
+    fields, those of the highest weight first, then spread over fields.
+    Each phase reads rows in id order, so ties go to the first ones as in
+    ContactIndex, and at most the number of contacts still to find: FTS5
+    never has to score or sort all the matches of a common word"""
+
+    def __init__(self, store, contacts):
+        self.store = store
+        self.contacts = contacts
+
+    def rank(self, query, idx):
+        name, nickname = self.store.names(idx)
+        return ContactIndex.key_rank(query, name, nickname)
+
+    def search(self, query, limit, accept=None, candidates=None, weights=None, fields=None):
+        """ Returns the numbers of the best limit contacts matching the
+        (normalized) query, and None for all the matches, which are not
+        collected. Takes the arguments of SegmentedIndex.search, the contacts
+        not having one of the fields being left out by SQLite """
+        if not query:
+            return [], None
+        store = self.store
+        refs = self.contacts.refs
+        refs.clear()
+        top = TopK(limit)
+
+        def consider(query_rows, rank_of, stop_rank):
+            # Only the rows seen in the earlier phases are read besides the
+            # limit ones still accepted
+            for idx, uid, fields, *text in query_rows(limit + len(refs)):
+                if idx in refs:
+                    continue
+                refs[idx] = store.card_ref(idx, uid, fields)
+                if accept is None or accept(idx):
+                    top.push(rank_of(*text), idx)
+                    if top.full() and top.worst() <= stop_rank:
+                        return True
+            return False
+
+        digits = ContactIndex.phone_query(query)
+        if digits:
+            exact = lambda phones: ContactIndex.RANK_EXACT
+            tail = lambda phones: ContactIndex.RANK_EXACT if digits in phones.split() else ContactIndex.RANK_NAME_PREFIX
+            consider(lambda n: store.phone_matches(f'phones : "{digits}"', fields, n), exact,
+                    ContactIndex.RANK_EXACT) or \
+                consider(lambda n: store.phone_matches(f'tails : "{digits[::-1]}"*', fields, n), tail,
+                    ContactIndex.RANK_NAME_PREFIX)
+            return [idx for _, idx in top.items()], None
+
+        words = FieldIndex.WORDS.findall(query)
+        if not words:
+            return [], None
+
+        def name_rank(name, nickname):
+            rank = ContactIndex.key_rank(query, name, nickname)
+            return rank if rank is not None else ContactIndex.RANK_SUBSTRING
+
+        phrase = " ".join(words)
+        terms = " ".join(f'"{word}"' for word in words[:-1]) + f' "{words[-1]}"*'
+        phases = [
+            (lambda n: store.exact(query, fields, n), ContactIndex.RANK_EXACT),
+            (lambda n: store.matches(f'name : ^"{phrase}"*', fields, n), ContactIndex.RANK_NAME_PREFIX)]
+        if len(words) == 1:
+            phases.append((lambda n: store.matches(f'last : "{phrase}"*', fields, n), ContactIndex.RANK_NAME_PREFIX))
+        phases.append((lambda n: store.matches(f'{{name nickname}} : "{phrase}"*', fields, n),
+            ContactIndex.RANK_WORD_BOUNDARY))
+        if len(words) > 1:
+            phases.append((lambda n: store.matches(f"{{name nickname}} : {terms}", fields, n),
+                ContactIndex.RANK_SUBSTRING))
+        for query_rows, stop_rank in phases:
+            if consider(query_rows, name_rank, stop_rank):
+                return [idx for _, idx in top.items()], None
+
+        if weights and any(weights):
+            # The fields of a weight, highest first, hold all the words (as
+            # scored by FieldIndex for a single word), then any of the fields
+            # hold some of them. Ranks grow in that order for TopK
+            field_rank = lambda name, nickname: ContactIndex.RANK_FIELDS + len(refs) / (1 + len(refs))
+            matches = []
+            for weight in sorted(set(weights) - {0}, reverse=True):
+                columns = [field for field, field_weight in zip(FieldIndex.FIELDS, weights) if field_weight == weight]
+                matches.append(f"{{{' '.join(columns)}}} : {terms}")
+            if len(words) > 1 and len(matches) > 1:
+                columns = [field for field, weight in zip(FieldIndex.FIELDS, weights) if weight]
+                matches.append(f"{{{' '.join(columns)}}} : {terms}")
+            for match in matches:
+                if consider(lambda n: store.matches(match, fields, n), field_rank, ContactIndex.RANK_FIELDS + 1):
+                    break
+        return [idx for _, idx in top.items()], None
+
+class SqliteContactSet(ContactSet):
+    """Snapshot of the contacts of a SqliteStore, positioned by row id.
+    Contacts of different files are not merged"""
+
+    def __init__(self, store):
+        self.store = store
+        self.files = {}
+        self.contacts = SqliteContacts(store)
+        self.index = SqliteIndex(store, self.contacts)
+        # The store leaves the hidden contacts out
+        self.hidden = frozenset()
+        self.merge = False
+        self.merge_keys = {}
+        self.merged_into = {}
+        self.cards = OrderedDict()
+        self.query_caches = {}
+        self.payloads = {}
+        self.action_payloads = {}
+
+    def position(self, uid):
+        return self.store.position(uid)
+
+    def size(self):
+        return self.store.count()
+
+class HitHistory(object):
+    """Frecency of the contacts used with each verb: a hit adds one to the
+    contact score, which halves every half_life_days. Hits are appended to a
+    JSON lines file by a writer thread, which rewrites the file with a single
+    line per contact once enough hits piled up, forgetting the contacts whose
+    score decayed below MIN_SCORE"""
+    HALF_LIFE_DAYS = 14
+    COMPACT_SLACK = 256
+    # A single hit some two months old with the default half-life
+    MIN_SCORE = 0.05
+
+    def __init__(self, path, warn, half_life_days=HALF_LIFE_DAYS):
+        self.path = path
+        self.warn = warn
+        self.half_life = half_life_days * 24 * 3600
+        self.scores = {}
+        self.lines = 0
+        self.lock = threading.Lock()
+        self.queue = queue.Queue()
+        self.writer = None
+
+    def decay(self, score, stamp, now):
+        return score * 0.5 ** ((now - stamp) / self.half_life)
+
+    def add(self, verb_name, contact_key, score, stamp):
+        scores = self.scores.setdefault(verb_name, {})
+        previous = scores.get(contact_key)
+        if previous:
+            score += self.decay(*previous, stamp)
+        scores[contact_key] = (score, stamp)
+
+    def load(self):
+        """ Folds the history file, which compaction keeps short """
+        self.scores = {}
+        self.lines = 0
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        verb_name, contact_key, score, stamp = json.loads(line)
+                    except ValueError:
+                        continue  # A torn last line
+                    self.add(verb_name, contact_key, score, stamp)
+                    self.lines += 1
+        except FileNotFoundError:
+            pass
+        # The next compaction drops their lines too
+        now = time.time()
+        self.scores = {verb_name: self.live(scores, now) for verb_name, scores in self.scores.items()}
+
+    def live(self, scores, now):
+        """ Returns the contact key -> (score, stamp) of the scores not
+        decayed below MIN_SCORE """
+        return {key: entry for key, entry in scores.items() if self.decay(*entry, now) >= self.MIN_SCORE}
+
+    def favorites(self, verb_name):
+        """ Returns the contact key -> current score of a verb """
+        now = time.time()
+        return {key: self.decay(*entry, now) for key, entry in self.scores.get(verb_name, {}).items()}
+
+    def record(self, verb_name, contact_key):
+        """ Counts a hit now and leaves writing it to the writer thread """
+        stamp = time.time()
+        with self.lock:
+            self.add(verb_name, contact_key, 1, stamp)
+            self.queue.put((verb_name, contact_key, 1, stamp))
+            if self.writer is None:
+                self.writer = threading.Thread(target=self.writer_main, name="PplHistory", daemon=True)
+                self.writer.start()
+
+    def size(self):
+        return sum(len(scores) for scores in self.scores.values())
+
+    def writer_main(self):
+        while True:
+            hit = self.queue.get()
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(hit) + "\n")
+                self.lines += 1
+                # With no hit pending, the scores hold exactly what the file
+                # holds. The hits recorded from then on are appended to the
+                # compacted file, by this thread, once it is written
+                lines = None
+                with self.lock:
+                    if self.queue.empty() and self.lines > self.size() + self.COMPACT_SLACK:
+                        lines = self.compacted_lines()
+                if lines is not None:
+                    self.compact(lines)
+            except OSError as exc:
+                self.warn(f"Failed to write hit history {self.path}, {exc}")
+
+    def compacted_lines(self):
+        """ Drops the contacts whose score decayed below MIN_SCORE and returns
+        the lines of the others. Called holding the lock """
+        now = time.time()
+        lines = []
+        for verb_name, scores in self.scores.items():
+            # A new dict, for favorites() may be going through the old one
+            kept = self.scores[verb_name] = self.live(scores, now)
+            lines.extend(json.dumps((verb_name, contact_key, score, stamp))
+                for contact_key, (score, stamp) in kept.items())
+        return lines
+
+    def compact(self, lines):
+        """ Rewrites the file with the lines, out of the lock for record()
+        not to wait for the file """
+        with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+            f.write("".join(line + "\n" for line in lines))
+        os.replace(self.path + ".tmp", self.path)
+        self.lines = len(lines)
+
+class Stats(object):
+    """Call counts and latency histograms of the plugin's hot paths, and
+    counters of events such as query cache hits. Methods are timed by
+    shadowing them with timing wrappers on the instance, so nothing is left
+    to pay for once the wrappers are removed. Latencies are counted in power
+    of two buckets of 1/16 ms"""
+    BUCKETS = 24
+    UNITS_PER_SECOND = 16000
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.counters = {}
+        # The transfer statistics of every remote source, see VcfFile.copy_changed
+        self.sources = {}
+        self.started = time.time()
+
+    def record(self, name, seconds):
+        bucket = min(int(seconds * self.UNITS_PER_SECOND).bit_length(), self.BUCKETS - 1)
+        with self.lock:
+            call = self.calls.get(name)
+            if call is None:
+                call = self.calls[name] = {"count": 0, "total": 0.0, "max": 0.0, "buckets": [0] * self.BUCKETS}
+            call["count"] += 1
+            call["total"] += seconds
+            call["max"] = max(call["max"], seconds)
+            call["buckets"][bucket] += 1
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def timed(self, name, method):
+        record = self.record
+        perf_counter = time.perf_counter
+
+        def timed_method(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                record(name, perf_counter() - start)
+        return timed_method
+
+    def instrument(self, obj, names):
+        for name in names:
+            setattr(obj, name, self.timed(name, getattr(obj, name)))
+
+    @staticmethod
+    def uninstrument(obj, names):
+        for name in names:
+            obj.__dict__.pop(name, None)
+
+    def percentile(self, call, fraction):
+        """ Returns the upper bound, in ms, of the bucket holding the percentile """
+        rank = fraction * call["count"]
+        seen = 0
+        for bucket, count in enumerate(call["buckets"]):
+            seen += count
+            if count and seen >= rank:
+                return min((1 << bucket) * 1000 / self.UNITS_PER_SECOND, call["max"] * 1000)
+        return call["max"] * 1000
+
+    def snapshot(self):
+        with self.lock:
+            calls = {name: dict(call, buckets=list(call["buckets"])) for name, call in self.calls.items()}
+            counters = dict(sorted(self.counters.items()))
+        return {
+            "started": datetime.datetime.fromtimestamp(self.started).isoformat(timespec="seconds"),
+            "bucket_ms": [(1 << bucket) * 1000 / self.UNITS_PER_SECOND for bucket in range(self.BUCKETS)],
+            "calls": {name: dict(call,
+                    mean_ms=call["total"] / call["count"] * 1000,
+                    p50_ms=self.percentile(call, 0.5),
+                    p90_ms=self.percentile(call, 0.9),
+                    p99_ms=self.percentile(call, 0.99),
+                    max_ms=call["max"] * 1000)
+                for name, call in sorted(calls.items())},
+            "counters": counters,
+            "sources": {source: dict(transfers,
+                    mb_per_s=transfers["bytes"] / transfers["seconds"] / 1e6 if transfers["seconds"] else None)
+                for source, transfers in sorted(self.sources.items())},
+        }
+
+    def summary(self, snapshot=None):
+        snapshot = snapshot or self.snapshot()
+        lines = [f"Ppl stats since {snapshot['started']} (ms, percentiles are bucket bounds)",
+            f"{'call':<20}\t{'count':>8}\t{'mean':>8}\t{'p50':>8}\t{'p90':>8}\t{'p99':>8}\t{'max':>8}"]
+        for name, call in snapshot["calls"].items():
+            lines.append(f"{name:<20}\t{call['count']:>8}" + "".join(f"\t{call[key]:>8.2f}"
+                for key in ("mean_ms", "p50_ms", "p90_ms", "p99_ms", "max_ms")))
+        for name, count in snapshot["counters"].items():
+            lines.append(f"{name:<20}\t{count:>8}")
+        if snapshot["sources"]:
+            lines.append(f"{'source':<20}\t{'checks':>8}\t{'copies':>8}\t{'failures':>8}\t{'MB':>8}\t{'MB/s':>8}")
+            for source, transfers in snapshot["sources"].items():
+                lines.append(f"{source:<20}\t{transfers['checks']:>8}\t{transfers['copies']:>8}\t"
+                    f"{transfers['failures']:>8}\t{transfers['bytes'] / 1e6:>8.2f}\t{transfers['mb_per_s'] or 0:>8.2f}")
+        return "\n".join(lines)
+
+    def dump(self, path):
+        """ Writes the stats as JSON, returns the snapshot written """
+        snapshot = self.snapshot()
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, indent=1)
+        os.replace(path + ".tmp", path)
+        return snapshot
 
 class VcfFile(object):
 
@@ -54,6 +1468,13 @@ class VcfFile(object):
     VCF_TAG_CELL = "TYPE=CELL"
     VCF_TAG_HOME = "TYPE=HOME"
     VCF_TAG_WORK = "TYPE=WORK"
+    # The journal of changes to a vCard file is next to it (see make_contacts.py)
+    JOURNAL_SUFFIX = ".journal"
+    # Sources are copied a chunk at a time to a part file, in a worker thread
+    # given up after a timeout
+    COPY_CHUNK_SIZE = 1024 * 1024
+    PART_SUFFIX = ".part"
+    SOURCE_TIMEOUT = 120
 
     filename: str
     source: str
@@ -64,17 +1485,817 @@ class VcfFile(object):
     home_tag: str
     work_tag: str
     custom_tag: bool
+    journal_of: str
+    source_timeout: int
+    source_hash: bool
+    lazy: bool
+    transfers: dict
+    copier: threading.Thread
+    cancelled: threading.Event
 
     def __init__(self, filename="", source="", reload_delta=60, encoding=None, \
-            cell_tag=None, home_tag=None, work_tag=None):
+            cell_tag=None, home_tag=None, work_tag=None, journal_of=None, source_timeout=None, source_hash=False,
+            lazy=False):
         self.filename = filename
         self.source = source
-        self.reload_delta = reload_delta
+        self.reload_delta = datetime.timedelta(hours=reload_delta) if reload_delta else None
+        self.next_reload = None
         self.encoding = encoding if encoding else "utf-8"
         self.custom_tag = not (not cell_tag and not home_tag and not work_tag)
         self.cell_tag = cell_tag if cell_tag else self.VCF_TAG_CELL
         self.home_tag = home_tag if home_tag else self.VCF_TAG_HOME
         self.work_tag = work_tag if work_tag else self.VCF_TAG_WORK
+        self.journal_of = journal_of
+        self.source_timeout = source_timeout if source_timeout else self.SOURCE_TIMEOUT
+        self.source_hash = source_hash
+        self.lazy = lazy
+        # Statistics of the source checks and copies
+        self.transfers = {"checks": 0, "unchanged": 0, "copies": 0, "failures": 0, "bytes": 0, "seconds": 0.0,
+            "last_bytes": 0, "last_seconds": 0.0, "last_error": None}
+        self.copier = None
+        self.cancelled = threading.Event()
+
+    def journal(self):
+        """ Returns the file of the journal of this file, read like it """
+        journal = VcfFile(self.filename + self.JOURNAL_SUFFIX, encoding=self.encoding, cell_tag=self.cell_tag,
+            home_tag=self.home_tag, work_tag=self.work_tag, journal_of=self.filename, lazy=self.lazy)
+        journal.custom_tag = self.custom_tag
+        return journal
+
+    def fingerprint(self, path, previous=None):
+        """ Identifies the file content and the settings affecting how it is
+        parsed and kept. The content is not hashed again when it has the size and
+        modification time of the previous fingerprint """
+        stat = os.stat(path)
+        settings = self.parse_settings()
+        if previous and previous[:3] == (os.path.abspath(path), stat.st_size, stat.st_mtime_ns) \
+                and previous[4:] == settings:
+            return previous
+        return (os.path.abspath(path), stat.st_size, stat.st_mtime_ns, self.digest(path)) + settings
+
+    def parse_settings(self):
+        """ Returns the settings affecting how the file is parsed and kept,
+        as plain values (fingerprints are stored as JSON) """
+        return (self.encoding, self.cell_tag, self.home_tag, self.work_tag, self.lazy)
+
+    def iter_contacts(self, path, start=0, end=None):
+        """ Yields the contacts of the byte range [start, end) of the file """
+        return iter_vcards(path, self, start, end)
+
+    def card_file(self, path, fingerprint):
+        """ Returns the CardFile reading back the cards of lazily loaded contacts """
+        return CardFile(path, self, fingerprint)
+
+    @classmethod
+    def digest(cls, path):
+        digest = hashlib.sha1()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(cls.COPY_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def same_content(fingerprint, other):
+        """ True if both fingerprints have the same content hash and settings
+        (e.g. a source copied again without changes) """
+        return fingerprint[:2] == other[:2] and fingerprint[3:] == other[3:]
+
+    def sync_source(self, path):
+        """ Copies the source file, and its journal, over the local copies when
+        due, that is once per session or every reload_delta if set, and
+        changed, and by every load until a copy succeeds. Returns True if anything was copied. The source is only
+        accessed by a worker thread, given up if not done within
+        source_timeout, so that a share which stops answering, even within a
+        read, cannot block the caller """
+        now = datetime.datetime.now()
+        if not self.source:
+            return False
+        if self.next_reload and now < self.next_reload and os.path.exists(path):
+            return False
+        if self.copier is not None and self.copier.is_alive():
+            # Still waiting for the share, never two copies to the same part file
+            raise TimeoutError(f"the previous copy of {self.source} is still not done")
+
+        outcome = {}
+
+        def copy_main():
+            try:
+                outcome["copied"] = self.copy_source(path)
+            except Exception as exc:
+                outcome["error"] = exc
+
+        self.cancelled = threading.Event()
+        self.copier = threading.Thread(target=copy_main, name="PplCopier", daemon=True)
+        self.copier.start()
+        self.copier.join(self.source_timeout)
+        if self.copier.is_alive():
+            # Told to give up, it removes its part file once the share answers
+            self.cancelled.set()
+            error = TimeoutError(f"copy not done after {self.source_timeout}s")
+            self.transfers["failures"] += 1
+            self.transfers["last_error"] = str(error)
+            raise error
+        if "error" in outcome:
+            raise outcome["error"]
+        # Only once copied: a failed copy is tried again by the next load
+        self.next_reload = now + self.reload_delta if self.reload_delta else datetime.datetime.max
+        return outcome["copied"]
+
+    def copy_source(self, path):
+        """ Copies the source file and its journal if changed, returns True if
+        anything was copied """
+        if not os.path.exists(self.source):
+            return False
+        copied = self.copy_changed(self.source, path)
+        # The journal goes along, or away once compacted into the file
+        if os.path.exists(self.source + self.JOURNAL_SUFFIX):
+            copied = self.copy_changed(self.source + self.JOURNAL_SUFFIX, path + self.JOURNAL_SUFFIX) or copied
+        elif os.path.exists(path + self.JOURNAL_SUFFIX):
+            os.remove(path + self.JOURNAL_SUFFIX)
+            copied = True
+        return copied
+
+    def copy_changed(self, source, path):
+        """ Copies source over path unless path already has its size and
+        modification time (and content, with source_hash). The copy goes to a
+        part file next to path, which replaces path once complete, so path is
+        never partly written. Returns True if copied """
+        transfers = self.transfers
+        transfers["checks"] += 1
+        source_stat = os.stat(source)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            stat = None
+        if stat and (stat.st_size, stat.st_mtime_ns) == (source_stat.st_size, source_stat.st_mtime_ns) \
+                and (not self.source_hash or self.digest(source) == self.digest(path)):
+            transfers["unchanged"] += 1
+            return False
+
+        start = time.perf_counter()
+        part_path = path + self.PART_SUFFIX
+        size = 0
+        try:
+            with open(source, "rb") as source_file, open(part_path, "wb") as part_file:
+                for chunk in iter(lambda: source_file.read(self.COPY_CHUNK_SIZE), b""):
+                    if self.cancelled.is_set():
+                        raise TimeoutError(f"copy not done after {self.source_timeout}s")
+                    part_file.write(chunk)
+                    size += len(chunk)
+            if size != source_stat.st_size:
+                raise OSError(f"{source} changed while copied")
+            if self.cancelled.is_set():
+                raise TimeoutError(f"copy not done after {self.source_timeout}s")
+            # The copy has the source time, which tells it is up to date
+            os.utime(part_path, ns=(source_stat.st_atime_ns, source_stat.st_mtime_ns))
+            os.replace(part_path, path)
+        except Exception as exc:
+            if not self.cancelled.is_set():
+                # Or counted by sync_source when it gave up
+                transfers["failures"] += 1
+                transfers["last_error"] = str(exc)
+            try:
+                os.remove(part_path)
+            except OSError:
+                pass
+            raise
+
+        seconds = time.perf_counter() - start
+        transfers["copies"] += 1
+        transfers["bytes"] += size
+        transfers["seconds"] += seconds
+        transfers["last_bytes"], transfers["last_seconds"], transfers["last_error"] = size, seconds, None
+        return True
+
+    def reload_due(self):
+        return bool(self.source and self.next_reload and datetime.datetime.now() >= self.next_reload)
+
+class TableFile(VcfFile):
+    """A contacts file of a [json/...] or [csv/...] section: one contact per
+    line of NDJSON (JSON objects, one per line) or per CSV row. columns maps
+    the contact fields (FIELDS) to the columns (JSON keys or CSV header
+    names) they are read from, the field name itself by default. A field may
+    take several columns: their values are joined for the name and the uid,
+    and kept apart otherwise (e.g. the first email is the main one, the
+    others alternate ones). Records which are not contacts with a name (or,
+    in a journal, a uid) are skipped, their line numbers kept in skipped for
+    the plugin to log"""
+    KINDS = ("json", "csv")
+    FIELDS = ("name", "nickname", "mail", "cell", "work", "home", "title", "org", "note", "uid")
+    PHONE_FIELDS = {"cell": f"TEL;{VcfFile.VCF_TAG_CELL}", "work": f"TEL;{VcfFile.VCF_TAG_WORK}",
+        "home": f"TEL;{VcfFile.VCF_TAG_HOME}"}
+
+    kind: str
+    columns: dict
+    delimiter: str
+
+    def __init__(self, filename, kind, columns=None, delimiter=",", **kwargs):
+        super().__init__(filename, **kwargs)
+        self.kind = kind
+        self.columns = {field: (field,) for field in self.FIELDS}
+        self.columns.update(columns or {})
+        self.delimiter = delimiter
+        self.skipped = []
+
+    def journal(self):
+        return TableFile(self.filename + self.JOURNAL_SUFFIX, self.kind, self.columns, self.delimiter,
+            encoding=self.encoding, journal_of=self.filename, lazy=self.lazy)
+
+    def parse_settings(self):
+        columns = ";".join(f"{field}={','.join(self.columns[field])}" for field in self.FIELDS)
+        return (self.encoding, self.kind, columns, self.delimiter, self.lazy)
+
+    def iter_contacts(self, path, start=0, end=None):
+        self.skipped = []
+        return (contact for _, _, contact in iter_table_records(path, self, start, end, skipped=self.skipped))
+
+    def card_file(self, path, fingerprint):
+        return TableCardFile(path, self, fingerprint)
+
+# vCard properties used by Ppl (in upper and lower case), other properties
+# are skipped without decoding
+VCARD_PROPERTIES = { name: name for name in [b"BEGIN", b"END", b"FN", b"TEL", b"EMAIL", b"TITLE", b"NICKNAME", b"NOTE", b"ORG", b"UID"] }
+VCARD_PROPERTIES.update({ name.lower(): name for name in VCARD_PROPERTIES })
+VCARD_FOLDING = re.compile(rb"\r?\n[ \t]")
+VCARD_BLOCK_SIZE = 1024 * 1024
+VCARD_ESCAPE = re.compile(r"\\(.)")
+VCARD_TEL_TYPES = [("CELL", VcfFile.VCF_TAG_CELL), ("HOME", VcfFile.VCF_TAG_HOME), ("WORK", VcfFile.VCF_TAG_WORK)]
+
+def unfold_vcard_lines(buf, start, end):
+    """ Yields the content lines of buf[start:end] as bytes, joining RFC 6350
+    folded lines and QUOTED-PRINTABLE soft line breaks """
+    line = None
+    pos = start
+    while pos < end:
+        eol = buf.find(b"\n", pos, end)
+        if eol < 0:
+            eol = end
+        raw = buf[pos:eol]
+        pos = eol + 1
+        if raw.endswith(b"\r"):
+            raw = raw[:-1]
+
+        if line is not None:
+            if raw[:1] in (b" ", b"\t"):
+                line += raw[1:]
+                continue
+            if line.endswith(b"=") and b"QUOTED-PRINTABLE" in line.partition(b":")[0].upper():
+                line += b"\n" + raw
+                continue
+            yield line
+        line = raw
+
+    if line is not None:
+        yield line
+
+def split_vcard_params(head):
+    """ Splits 'name;param;param' on the semicolons outside quoted values """
+    if not b'"' in head:
+        return head.split(b";")
+    parts = []
+    part = b""
+    quoted = False
+    for c in head.split(b'"'):
+        if quoted:
+            part += b'"' + c + b'"'
+        else:
+            pieces = c.split(b";")
+            part += pieces[0]
+            for piece in pieces[1:]:
+                parts.append(part)
+                part = piece
+        quoted = not quoted
+    parts.append(part)
+    return parts
+
+def vcard_value_colon(line):
+    """ Returns the position of the ':' ending the property name and
+    parameters - the first one outside quoted parameter values """
+    colon = line.find(b":")
+    quote = line.find(b'"', 0, colon)
+    while quote >= 0:
+        closing = line.find(b'"', quote + 1)
+        if closing < 0:
+            return colon
+        colon = line.find(b":", closing + 1)
+        quote = line.find(b'"', closing + 1, colon)
+    return colon
+
+def vcard_tel_field(params, vcard_file):
+    """ Maps TEL parameters to a contact phone field, e.g. TEL;TYPE=CELL """
+    field = ";".join(["TEL"] + params)
+    if vcard_file.custom_tag:
+        if vcard_file.cell_tag in field:
+            return "TEL;"+VcfFile.VCF_TAG_CELL
+        elif vcard_file.home_tag in field:
+            return "TEL;"+VcfFile.VCF_TAG_HOME
+        elif vcard_file.work_tag in field:
+            return "TEL;"+VcfFile.VCF_TAG_WORK
+        return field
+
+    types = set()
+    for param in params:
+        key, _, value = param.partition("=")
+        if not value:
+            types.add(key.upper())
+        elif key.upper() == "TYPE":
+            types.update(value.strip('"').upper().split(","))
+    for vcf_type, tag in VCARD_TEL_TYPES:
+        if vcf_type in types:
+            return "TEL;" + tag
+    return field
+
+def vcard_line_blocks(buf, start, end):
+    """ Yields the content lines of buf[start:end] in blocks of about
+    VCARD_BLOCK_SIZE bytes. Line ends and folding are handled a block at a
+    time, only blocks with QUOTED-PRINTABLE values are unfolded line by line """
+    while start < end:
+        block_end = end
+        if end - start > VCARD_BLOCK_SIZE:
+            # Blocks end before a line which does not continue a folded line
+            block_end = buf.find(b"\nBEGIN:VCARD", start + VCARD_BLOCK_SIZE, end)
+            block_end = end if block_end < 0 else block_end + 1
+        block = buf[start:block_end]
+        start = block_end
+
+        if b"QUOTED-PRINTABLE" in block or b"quoted-printable" in block:
+            yield unfold_vcard_lines(block, 0, len(block))
+            continue
+        if b"\r" in block:
+            block = block.replace(b"\r\n", b"\n")
+        if b"\n " in block or b"\n\t" in block:
+            block = VCARD_FOLDING.sub(b"", block)
+        yield block.split(b"\n")
+
+def iter_vcards(vcf_file_path, vcard_file, start=0, end=None):
+    """ Yields the contacts of the byte range [start, end) of a vCard file.
+
+    The memory mapped file is scanned as bytes and only the properties in
+    VCARD_PROPERTIES are decoded, handling folded lines, group prefixes
+    (item1.TITLE), quoted parameters, QUOTED-PRINTABLE values and escapes """
+    encoding = vcard_file.encoding
+    with open(vcf_file_path, "rb") as vcf:
+        size = os.fstat(vcf.fileno()).st_size
+        end = size if end is None else min(end, size)
+        if end <= start:
+            return
+        buf = mmap.mmap(vcf.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if "BEGIN:VCARD\n".encode(encoding) != b"BEGIN:VCARD\n":
+                # Not an ASCII compatible encoding (e.g. UTF-16), scan it as UTF-8
+                buf = buf[start:end].decode(encoding).encode("utf-8")
+                start, end, encoding = 0, len(buf), "utf-8"
+            elif buf[start:start + 3] == b"\xef\xbb\xbf":
+                start += 3
+            yield from _parse_vcard_lines(vcard_line_blocks(buf, start, end), vcard_file, encoding)
+        finally:
+            if isinstance(buf, mmap.mmap):
+                buf.close()
+
+def vcard_property(head, vcard_file, encoding):
+    """ Returns (property, tel field, value encoding, quoted printable, pref)
+    for the 'group.name;params' head of a content line, or None for the
+    properties not used by Ppl """
+    parts = split_vcard_params(head)
+    prop = VCARD_PROPERTIES.get(parts[0].rsplit(b".", 1)[-1].upper())
+    if prop is None:
+        return None
+
+    params = [param.decode("ascii", "replace") for param in parts[1:]]
+    value_encoding = encoding
+    quoted_printable = pref = False
+    for param in params:
+        key, _, param_value = param.partition("=")
+        key = key.upper()
+        if key == "CHARSET":
+            value_encoding = param_value.strip('"')
+        elif (key == "ENCODING" and param_value.upper() == "QUOTED-PRINTABLE") or key == "QUOTED-PRINTABLE":
+            quoted_printable = True
+        elif "PREF" in param.upper():
+            pref = True
+    field = vcard_tel_field(params, vcard_file) if prop == b"TEL" else None
+    return (prop, field, value_encoding, quoted_printable, pref)
+
+def _parse_vcard_lines(blocks, vcard_file, encoding):
+    # Content line heads repeat from card to card, their parsing is cached
+    heads = {}
+    strings = {}
+    contact = None
+    for lines in blocks:
+        for line in lines:
+            colon = line.find(b":")
+            if colon < 0:
+                continue
+            head = line[:colon]
+            prop = heads.get(head, False)
+            if prop is False:
+                if head.count(b'"') % 2:
+                    # The ':' is within a quoted parameter value
+                    colon = vcard_value_colon(line)
+                    prop = vcard_property(line[:colon], vcard_file, encoding)
+                else:
+                    prop = vcard_property(head, vcard_file, encoding)
+                    if len(heads) < 4096:
+                        heads[head] = prop
+            if prop is None:
+                continue
+
+            prop, field, value_encoding, quoted_printable, pref = prop
+            value = line[colon + 1:]
+            if prop == b"BEGIN":
+                if value == b"VCARD" or value.strip().upper() == b"VCARD":
+                    contact = Contact()
+                    phones = {}
+                    descriptions = []
+                    details = []
+                    mails = None
+                continue
+            elif prop == b"END":
+                if contact and (value == b"VCARD" or value.strip().upper() == b"VCARD"):
+                    description = ", ".join(descriptions)
+                    contact.description = strings.setdefault(description, description)
+                    contact.phones = tuple(phones.items())
+                    if mails:
+                        contact.alt_mails = tuple(mail for mail in mails if mail != contact.mail)
+                    if details:
+                        contact.details = tuple(details)
+                    yield contact
+                    contact = None
+                continue
+            elif contact is None:
+                continue
+
+            if quoted_printable:
+                value = quopri.decodestring(value)
+            value = value.decode(value_encoding, "replace").strip()
+            if "\\" in value:
+                value = VCARD_ESCAPE.sub(lambda m: "\n" if m.group(1) in "nN" else m.group(1), value)
+
+            if prop == b"FN":
+                contact.name = value
+            elif prop == b"TEL":
+                phones[field] = value
+            elif prop == b"EMAIL":
+                if value:
+                    if contact.mail and value != contact.mail:
+                        # Rare enough to collect only from a second email on
+                        if mails is None:
+                            mails = [contact.mail]
+                        if value not in mails:
+                            mails.append(value)
+                    if not contact.mail or pref:
+                        contact.mail = value
+            elif prop == b"ORG":
+                if value:
+                    details.append(("org", strings.setdefault(value, value)))
+            elif prop == b"UID":
+                # Replaced by the contact id, see assign_contact_ids
+                contact.uid = value
+            elif value:
+                # TITLE, NICKNAME and NOTE make the contact description
+                if prop == b"NICKNAME":
+                    contact.nickname = value
+                elif prop == b"TITLE":
+                    details.append(("title", strings.setdefault(value, value)))
+                else:
+                    details.append(("note", value))
+                descriptions.append(value)
+
+def parse_vcard_range(vcf_file_path, vcard_file, start=0, end=None):
+    """ Parses the cards (or records, of a TableFile) in the byte range
+    [start, end) of a contacts file """
+    with paused_gc():
+        return list(vcard_file.iter_contacts(vcf_file_path, start, end))
+
+def assign_contact_ids(filename, contacts):
+    """ Sets the uid of the contacts of a file to a hash of the file name and
+    the card UID, or else the contact name and email, numbering contacts
+    which share these. A journal's contacts get the ids of the contacts of
+    its file they replace """
+    for _ in iter_contact_ids(filename, contacts):
+        pass
+    return contacts
+
+def iter_contact_ids(filename, contacts):
+    """ Yields the contacts of a file as they come, their uid set as by
+    assign_contact_ids """
+    seen = {}
+    for contact in contacts:
+        if contact.uid:
+            key = f"{filename}\0\0{contact.uid}"
+            contact.uid = hashlib.blake2b(key.encode("utf-8"), digest_size=8).hexdigest()
+            yield contact
+            continue
+        key = f"{filename}\0{contact.name}\0{contact.mail}"
+        uid = hashlib.blake2b(key.encode("utf-8"), digest_size=8).hexdigest()
+        count = seen.get(uid, 0)
+        seen[uid] = count + 1
+        contact.uid = f"{uid}-{count}" if count else uid
+        yield contact
+
+def verb_fields(contact):
+    """ Returns the fields a contact has of those verbs act on """
+    return tuple(field for field in ("name", "mail") if getattr(contact, field)) + \
+        tuple(field for field, number in contact.phones if number)
+
+# A BEGIN:VCARD line, past the byte order mark of the file
+VCARD_BEGIN = re.compile(rb"^(?:\xef\xbb\xbf)?((?:[\w-]+\.)?BEGIN:[ \t]*VCARD[ \t]*\r?$)", re.I | re.M)
+
+def vcard_spans(vcf_file_path, encoding):
+    """ Returns the (offset, length) of the cards of a vCard file, each from
+    its BEGIN:VCARD line to the next one, or None for files in encodings
+    where BEGIN:VCARD is not plain ASCII """
+    if "BEGIN:VCARD\n".encode(encoding) != b"BEGIN:VCARD\n":
+        return None
+    with open(vcf_file_path, "rb") as vcf:
+        size = os.fstat(vcf.fileno()).st_size
+        if not size:
+            return []
+        buf = mmap.mmap(vcf.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            starts = [match.start(1) for match in VCARD_BEGIN.finditer(buf)]
+        finally:
+            buf.close()
+    return [(start, end - start) for start, end in zip(starts, starts[1:] + [size])]
+
+class CardFile(object):
+    """The vCard file of lazily loaded contacts, as it was when loaded: its
+    cards are read back one at a time (with a seek, the file is not kept
+    open or mapped so that its source can still be copied over it) and only
+    while the file keeps the size and modification time it was loaded with.
+    Also stands for the VcfFile settings when parsing them"""
+
+    def __init__(self, path, vcard_file, fingerprint):
+        self.path = path
+        self.encoding = vcard_file.encoding
+        self.custom_tag = vcard_file.custom_tag
+        self.cell_tag = vcard_file.cell_tag
+        self.home_tag = vcard_file.home_tag
+        self.work_tag = vcard_file.work_tag
+        self.size, self.mtime_ns = fingerprint[1:3]
+
+    def unchanged(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return False
+        return (stat.st_size, stat.st_mtime_ns) == (self.size, self.mtime_ns)
+
+    def refs(self, contacts):
+        """ Returns the CardRefs of the parsed contacts of the file, None if
+        its cards cannot be told apart (e.g. a BEGIN:VCARD without END) """
+        return self.span_refs(contacts, vcard_spans(self.path, self.encoding))
+
+    def span_refs(self, contacts, spans):
+        """ Returns the CardRefs of the contacts at the (offset, length) spans
+        of the file, None if they do not pair up """
+        if spans is None or len(spans) != len(contacts):
+            return None
+        fields = {}
+        refs = []
+        for contact, (offset, length) in zip(contacts, spans):
+            contact_fields = verb_fields(contact)
+            refs.append(CardRef(contact.uid, fields.setdefault(contact_fields, contact_fields), self, offset, length))
+        return refs
+
+    def read(self, ref):
+        """ Returns the Contact of a card, None if the file changed """
+        if not self.unchanged():
+            return None
+        try:
+            with open(self.path, "rb") as vcf:
+                vcf.seek(ref.offset)
+                card = vcf.read(ref.length)
+        except OSError:
+            return None
+        contact = next(_parse_vcard_lines(vcard_line_blocks(card, 0, len(card)), self, self.encoding), None)
+        if contact is not None:
+            contact.uid = ref.uid
+        return contact
+
+    @staticmethod
+    def contacts_of(contacts):
+        """ Returns the contacts of a file with CardRefs read back, all the
+        file at once, or empty contacts if the file changed """
+        if not contacts or not isinstance(contacts[0], CardRef):
+            return contacts
+        card_file = contacts[0].card_file
+        if not card_file.unchanged():
+            return [Contact() for _ in contacts]
+        return card_file.contacts()
+
+    def contacts(self):
+        """ Yields the contacts of all the file """
+        return iter_vcards(self.path, self)
+
+def ascii_lines(encoding):
+    """ True if the encoding writes newlines and ASCII as single bytes, so
+    that a file in it can be split into lines as bytes """
+    return "\n{,".encode(encoding).endswith(b"\n{,")
+
+def table_lines(path, encoding, position, start=0, end=None):
+    """ Yields the lines of the byte range [start, end) of a file as text, a
+    buffered read at a time, position[0] being the offset past the last line
+    yielded. Files in encodings where lines cannot be split as bytes are
+    read as text, all of them, position[0] being None """
+    if not ascii_lines(encoding):
+        position[0] = None
+        with open(path, "r", encoding=encoding, errors="replace", newline="") as f:
+            yield from f
+        return
+
+    with open(path, "rb") as f:
+        end = os.fstat(f.fileno()).st_size if end is None else end
+        f.seek(start)
+        offset = start
+        for line in f:
+            if offset >= end:
+                break
+            text = line.decode(encoding, "replace")
+            if offset == 0 and text.startswith("\ufeff"):
+                text = text[1:]
+            offset += len(line)
+            position[0] = offset
+            yield text
+
+def json_line(text):
+    """ Returns an NDJSON line without the brackets and commas of a JSON
+    array written an object per line, so that such arrays load too """
+    return text.strip().lstrip("[").rstrip("],").strip()
+
+def json_record(text):
+    """ Returns the JSON object of an NDJSON line, None if the line is not
+    a valid one """
+    text = json_line(text)
+    if not text.startswith("{"):
+        return None
+    try:
+        record = json.loads(text)
+    except ValueError:
+        return None
+    return record if isinstance(record, dict) else None
+
+def json_texts(value):
+    """ Returns the texts of a JSON value which is not a string: numbers
+    and lists of strings and numbers """
+    values = value if isinstance(value, list) else (value,)
+    return [value if isinstance(value, str) else str(value) for value in values
+        if isinstance(value, (str, int, float)) and not isinstance(value, bool)]
+
+def column_pairs(columns):
+    """ Returns the (field, column) pairs of a TableFile columns mapping """
+    return [(field, column) for field, field_columns in columns.items() for column in field_columns]
+
+def csv_pairs(header, columns):
+    """ Returns the (field, position) pairs of the columns in a CSV header """
+    positions = {}
+    for position, name in enumerate(header):
+        positions.setdefault(name.strip(), position)
+    return [(field, positions[column]) for field, column in column_pairs(columns) if column in positions]
+
+def table_contact(pairs, strings):
+    """ Returns the Contact of the (field, value) pairs of a record, values
+    being texts, or JSON numbers and lists. Strings repeating from record to
+    record (titles, organizations) are shared """
+    texts = {}
+    for field, value in pairs:
+        for text in (value,) if value.__class__ is str else json_texts(value):
+            text = text.strip()
+            if text:
+                field_texts = texts.get(field)
+                if field_texts is None:
+                    texts[field] = [text]
+                else:
+                    field_texts.append(text)
+
+    contact = Contact()
+    get = texts.get
+    if "name" in texts:
+        contact.name = " ".join(texts["name"])
+    if "uid" in texts:
+        contact.uid = " ".join(texts["uid"])
+    mails = get("mail")
+    if mails:
+        contact.mail = mails[0]
+        if len(mails) > 1:
+            contact.alt_mails = tuple(mail for mail in dict.fromkeys(mails[1:]) if mail != mails[0])
+    contact.phones = tuple((tel_field, get(field)[0]) for field, tel_field in TableFile.PHONE_FIELDS.items()
+        if field in texts)
+    description = []
+    details = []
+    for title in get("title", ()):
+        title = strings.setdefault(title, title)
+        details.append(("title", title))
+        description.append(title)
+    if "nickname" in texts:
+        contact.nickname = ", ".join(texts["nickname"])
+        description.append(contact.nickname)
+    for org in get("org", ()):
+        details.append(("org", strings.setdefault(org, org)))
+    for note in get("note", ()):
+        details.append(("note", note))
+        description.append(note)
+    if details:
+        contact.details = tuple(details)
+    description = ", ".join(description)
+    contact.description = strings.setdefault(description, description)
+    return contact
+
+def iter_table_records(path, table_file, start=0, end=None, parse=True, skipped=None):
+    """ Yields the (offset, length, contact) of the records of the byte range
+    [start, end) of a table file, reading it a line at a time. Offsets are
+    None in encodings where lines cannot be split as bytes (e.g. UTF-16),
+    contacts None unless parse. CSV files are read whole, from their header.
+    Blank lines and rows are passed over, the line numbers of the other
+    records which are not contacts (see usable_record) added to skipped """
+    position = [start]
+    lines = table_lines(path, table_file.encoding, position, start, end)
+    strings = {}
+    offset = start
+    journal = bool(table_file.journal_of)
+    if table_file.kind == "csv":
+        rows = csv.reader(lines, delimiter=table_file.delimiter)
+        header = next(rows, None)
+        if header is None:
+            return
+        pairs = csv_pairs(header, table_file.columns)
+        offset = position[0]
+        for row in rows:
+            # The row ends past the lines the reader took for it
+            next_offset = position[0]
+            if any(row):
+                contact = table_contact([(field, row[column]) for field, column in pairs if column < len(row)],
+                    strings)
+                if usable_record(contact, journal):
+                    yield offset, next_offset - offset if offset is not None else None, contact if parse else None
+                elif skipped is not None:
+                    skipped.append(rows.line_num)
+            offset = next_offset
+        return
+
+    pairs = column_pairs(table_file.columns)
+    for number, line in enumerate(lines, 1):
+        next_offset = position[0]
+        # The brackets of a JSON array written an object per line are blank
+        if json_line(line):
+            record = json_record(line)
+            contact = table_contact([(field, record[column]) for field, column in pairs if column in record],
+                strings) if record is not None else None
+            if contact is not None and usable_record(contact, journal):
+                yield offset, next_offset - offset if offset is not None else None, contact if parse else None
+            elif skipped is not None:
+                skipped.append(number)
+        offset = next_offset
+
+def usable_record(contact, journal):
+    """ True if the contact of a table record has a name, or is in a journal
+    and has a uid, deleting the contact with that uid """
+    return bool(contact.name or journal and contact.uid)
+
+class TableCardFile(CardFile):
+    """The table file of lazily loaded contacts, whose records are read back
+    one at a time as CardFile reads cards"""
+
+    def __init__(self, path, table_file, fingerprint):
+        self.path = path
+        self.encoding = table_file.encoding
+        self.kind = table_file.kind
+        self.columns = table_file.columns
+        self.delimiter = table_file.delimiter
+        self.journal_of = table_file.journal_of
+        self.size, self.mtime_ns = fingerprint[1:3]
+        self.pairs = None
+
+    def refs(self, contacts):
+        spans = [(offset, length) for offset, length, _ in iter_table_records(self.path, self, parse=False)]
+        if any(offset is None for offset, _ in spans):
+            return None
+        return self.span_refs(contacts, spans)
+
+    def read(self, ref):
+        if not self.unchanged():
+            return None
+        try:
+            if self.kind == "csv" and self.pairs is None:
+                header = next(csv.reader(table_lines(self.path, self.encoding, [0]), delimiter=self.delimiter), [])
+                self.pairs = csv_pairs(header, self.columns)
+            with open(self.path, "rb") as f:
+                f.seek(ref.offset)
+                text = f.read(ref.length).decode(self.encoding, "replace").lstrip("\ufeff")
+        except OSError:
+            return None
+        if self.kind == "csv":
+            row = next(csv.reader(text.splitlines(keepends=True), delimiter=self.delimiter), [])
+            pairs = [(field, row[column]) for field, column in self.pairs if column < len(row)]
+        else:
+            record = json_record(text) or {}
+            pairs = [(field, record[column]) for field, column in column_pairs(self.columns) if column in record]
+        contact = table_contact(pairs, {})
+        contact.uid = ref.uid
+        return contact
+
+    def contacts(self):
+        return (contact for _, _, contact in iter_table_records(self.path, self))
 
 class Ppl(kp.Plugin):
     #vcf_tel_parser = re.compile(r'^TEL;TYPE=(?P<type>(TYPE=)[a-zA-Z][a-zA-Z0-9]*)$')
@@ -104,14 +2325,18 @@ class Ppl(kp.Plugin):
     ITEMCAT_CONTACT = kp.ItemCategory.USER_BASE + 1
     ITEMCAT_ACTION = kp.ItemCategory.USER_BASE + 2
     ITEMCAT_COPY = kp.ItemCategory.USER_BASE + 3
+    ITEMCAT_STATS = kp.ItemCategory.USER_BASE + 4
 
     ITEM_LABEL_PREFIX = "Ppl: "
+    MAX_SUGGESTIONS = 11
     
     ID_NAME = "name"
     
     SAMPLE_VCF = r"sample-contacts.vcf"
     PACKAGED_SAMPLE_VCF = r"etc\sample-contacts.vcf"
     VCF_SECTION_PREFIX = "vcf/"
+    # Spelled out delimiters of [csv/...] sections
+    CSV_DELIMITERS = {"tab": "\t", "\\t": "\t", "comma": ",", "semicolon": ";", "pipe": "|"}
     
     COPY_VERB = Verb('Copy',   'Copy contact detail',     '',  ACTION_COPY)
     VERB_LIST = [
@@ -126,126 +2351,461 @@ class Ppl(kp.Plugin):
     ]
     
     CONTACTS_FILE = "contacts.json"
+    CACHE_DIR = "ppl-cache"
+    STORE_FILE = "contacts.sqlite3"
+    CACHE_VERSION = 13
+    HISTORY_FILE = "ppl-history.jsonl"
+    STATS_FILE = "ppl-stats.json"
+    STATS_TARGET = "Stats"
+    # Default weights of the FieldIndex.FIELDS matches
+    FIELD_WEIGHTS = {"name": 4, "nickname": 3, "mail": 2, "title": 3, "org": 2, "note": 1}
+    # Methods timed when stats are on
+    STATS_METHODS = ("on_suggest", "suggest_contacts", "suggest_actions", "suggest_copy", "find_contacts",
+        "boost_favorites", "on_execute", "load_contacts", "sync_sources", "load_cache", "save_cache", "build_index")
 
     def __init__(self):
         super().__init__()
         self.debug = True
+        self.vcard_files = []
+        self.contact_set = ContactSet()
+        self.loader = None
+        self.load_requested = False
+        self.load_lock = threading.Lock()
+        self.history = None
+        self.stats = None
+        self.field_weights = tuple(self.FIELD_WEIGHTS[field] for field in FieldIndex.FIELDS)
+        self.transliterate = False
+        self.store_kind = "memory"
+        self.store = None
 
     def load_vcard_file(self, vcf_file_path, vcard_file = None):
         self.info(f"Loading contacts file {vcf_file_path}")
-        encoding = vcard_file.encoding if vcard_file else "utf-8"
-
-        with open(vcf_file_path, "r", encoding=encoding) as vcf:
-            contact = Contact()
-            for line in vcf:
-                if "BEGIN:VCARD\n" == line:
-                    contact = {} #Contact()
-                    contact[self.AD_ATTR_MAIL] = ""
-                    contact[self.AD_ATTR_TITLE] = ""
-                    continue
-                elif line.startswith("END:VCARD"):
-                    if contact:
-                        self.contacts.append(contact)
-                    contact = Contact()
-                    continue
-
-                parts = line.strip().rsplit(':', 1)
-                # tel_match = self.vcf_tel_parser.match(parts[0])
-                # elif tel_match:
-                #     print(f"{tel_match['type']} --> {parts[1]}\n")
-                vcf_field = parts[0]
-                if "FN" == vcf_field:
-                    contact[self.AD_ATTR_NAME] = parts[1]
-                elif vcf_field.startswith("TEL;"):
-                    if vcard_file.custom_tag:
-                        if vcard_file.cell_tag in vcf_field:
-                            vcf_field = "TEL;"+VcfFile.VCF_TAG_CELL
-                        elif vcard_file.home_tag in vcf_field:
-                            vcf_field = "TEL;"+VcfFile.VCF_TAG_HOME
-                        elif vcard_file.work_tag in vcf_field:
-                            vcf_field = "TEL;"+VcfFile.VCF_TAG_WORK
-                    contact[vcf_field] = parts[1]
-                elif vcf_field.startswith("EMAIL;"):
-                    contact[self.AD_ATTR_MAIL] = parts[1]
-                elif vcf_field.startswith("TITLE"):
-                    contact[self.AD_ATTR_TITLE] += parts[1]
-                elif vcf_field.startswith("NICKNAME"):
-                    contact[self.AD_ATTR_TITLE] += parts[1]
-                elif vcf_field.startswith("NOTE"):
-                    contact[self.AD_ATTR_TITLE] += parts[1]
+        return parse_vcard_range(vcf_file_path, vcard_file if vcard_file else VcfFile())
 
     def get_vcf_files(self):
         vcard_files = []
 
+        lazy = self.settings.get_bool("lazy_contacts", "main", False)
         vcard_file_list = self.settings.get_multiline("vcard_files", "main", [])
         for vcard_file in vcard_file_list:
-            vcard_files.append(VcfFile(vcard_file))
+            vcard_files.append(VcfFile(vcard_file, lazy=lazy))
 
         for section in self.settings.sections():
-            if section.lower().startswith(self.VCF_SECTION_PREFIX):
-                vcard_file = section[len(self.VCF_SECTION_PREFIX):].strip()
-                if not vcard_file in vcard_file_list:
-                    source = self.settings.get_stripped("source", section=section, fallback=None)
-                    reload_delta_hours = self.settings.get_int("reload_delta_hours", section=section, fallback=None, min=0)
-                    encoding = self.settings.get_stripped("encoding", section=section, fallback=None)
-                    cell_tag = self.settings.get_stripped("cell_tag", section=section, fallback=None)
-                    home_tag = self.settings.get_stripped("home_tag", section=section, fallback=None)
-                    work_tag = self.settings.get_stripped("work_tag", section=section, fallback=None)
-                    vcard_files.append(VcfFile(vcard_file, source, reload_delta_hours, encoding, cell_tag, home_tag, work_tag))
+            kind, _, vcard_file = section.partition("/")
+            kind = kind.strip().lower()
+            vcard_file = vcard_file.strip()
+            if kind + "/" != self.VCF_SECTION_PREFIX and kind not in TableFile.KINDS:
+                continue
+            if vcard_file in vcard_file_list:
+                continue
+            source = self.settings.get_stripped("source", section=section, fallback=None)
+            reload_delta_hours = self.settings.get_int("reload_delta_hours", section=section, fallback=None, min=0)
+            encoding = self.settings.get_stripped("encoding", section=section, fallback=None)
+            source_timeout = self.settings.get_int("source_timeout", section=section, fallback=None, min=1)
+            source_hash = self.settings.get_bool("source_hash", section=section, fallback=False)
+            if kind in TableFile.KINDS:
+                # e.g. mail = mail, otherMailbox
+                columns = {}
+                for field in TableFile.FIELDS:
+                    value = self.settings.get_stripped(field, section=section, fallback=None)
+                    if value:
+                        columns[field] = tuple(column.strip() for column in value.split(",") if column.strip())
+                delimiter = self.settings.get("delimiter", section=section, fallback=",", unquote=True) or ","
+                delimiter = self.CSV_DELIMITERS.get(delimiter.strip().lower(), delimiter)
+                vcard_files.append(TableFile(vcard_file, kind, columns, delimiter, source=source,
+                    reload_delta=reload_delta_hours, encoding=encoding, source_timeout=source_timeout,
+                    source_hash=source_hash, lazy=lazy))
+                continue
+            cell_tag = self.settings.get_stripped("cell_tag", section=section, fallback=None)
+            home_tag = self.settings.get_stripped("home_tag", section=section, fallback=None)
+            work_tag = self.settings.get_stripped("work_tag", section=section, fallback=None)
+            vcard_files.append(VcfFile(vcard_file, source, reload_delta_hours, encoding, cell_tag, home_tag, work_tag,
+                source_timeout=source_timeout, source_hash=source_hash, lazy=lazy))
 
         return vcard_files
 
-    def load_contacts_and_settings(self):
-        self.contacts = []
+    def build_index(self, contacts):
+        with paused_gc():
+            index = ContactIndex(((contact.name, contact.nickname) for contact in contacts),
+                [[number for _, number in contact.phones] for contact in contacts],
+                (self.contact_fields(contact) for contact in contacts), self.transliterate)
+        self.info(f"Indexed {len(contacts)} contacts ({len(index.name_trie) + len(index.word_trie)} words, "
+            f"{len(index.trigrams)} trigrams, {len(index.phone_trie)} phone numbers, {len(index.fields)} field words)")
+        return index
+
+    def card_refs(self, vcard_file, vcard_file_path, fingerprint, contacts):
+        """ Returns the CardRefs keeping the place of the indexed contacts of a
+        lazily loaded file, or the contacts if their cards cannot be found """
+        try:
+            refs = vcard_file.card_file(vcard_file_path, fingerprint).refs(contacts)
+        except Exception as exc:
+            refs = None
+            self.warn(f"Failed to locate the cards of {vcard_file_path}, {exc}")
+        if refs is None:
+            self.warn(f"Keeping the {len(contacts)} contacts of {vcard_file_path} loaded, their cards cannot be located in the file")
+            return contacts
+        return refs
+
+    @staticmethod
+    def contact_fields(contact):
+        """ Returns the (field, text) of a contact for its FieldIndex """
+        fields = [("name", contact.name)]
+        if contact.nickname:
+            fields.append(("nickname", contact.nickname))
+        if contact.mail:
+            fields.append(("mail", contact.mail))
+        fields.extend(("mail", mail) for mail in contact.alt_mails)
+        fields.extend(contact.details)
+        return fields
 
+    def cache_path(self, fingerprint):
+        name = hashlib.sha1(fingerprint[0].encode("utf-8")).hexdigest()[:16]
+        return os.path.join(kp.user_config_dir(), self.CACHE_DIR, f"{name}.cache")
+
+    def load_cache(self, fingerprint):
+        """ Returns the cached (contacts, index) of a file fingerprint or None """
+        cache_path = self.cache_path(fingerprint)
+        if not os.path.exists(cache_path):
+            return None
+        try:
+            with paused_gc(), open(cache_path, "rb") as f:
+                cache = pickle.load(f)
+            if cache.get("version") == self.CACHE_VERSION and cache.get("fingerprint") == fingerprint:
+                return cache["contacts"], cache["index"]
+        except Exception as exc:
+            self.warn(f"Failed to load contacts cache {cache_path}, {exc}")
+        return None
+
+    def save_cache(self, fingerprint, contacts, index):
+        cache_path = self.cache_path(fingerprint)
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            with open(cache_path + ".tmp", "wb") as f:
+                pickle.dump({
+                    "version": self.CACHE_VERSION,
+                    "fingerprint": fingerprint,
+                    "contacts": contacts,
+                    "index": index}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(cache_path + ".tmp", cache_path)
+        except Exception as exc:
+            self.warn(f"Failed to save contacts cache {cache_path}, {exc}")
+
+    def load_contacts_and_settings(self):
         self.call_protocol = self.settings.get_stripped("call_protocol", "main", self.CALLING_PROTOCOL)
         self.chat_protocol = self.settings.get_stripped("chat_protocol", "main", self.CALLING_PROTOCOL)
         self.cell_protocol = self.settings.get_stripped("cell_protocol", "main", self.CELL_PROTOCOL)
         self.home_protocol = self.settings.get_stripped("home_protocol", "main", self.CELL_PROTOCOL)
         self.mail_protocol = self.settings.get_stripped("mail_protocol", "main", self.MAILING_PROTOCOL)
+        self.cache_contacts = self.settings.get_bool("cache_contacts", "main", True)
+        self.merge_contacts = self.settings.get_bool("merge_contacts", "main", True)
+        field_weights = tuple(self.settings.get_float(f"{field}_weight", "main", self.FIELD_WEIGHTS[field], min=0)
+            for field in FieldIndex.FIELDS)
+        if field_weights != self.field_weights:
+            # The cached matches are those of the previous weights
+            self.field_weights = field_weights
+            self.contact_set.query_caches = {}
+        # The contacts are indexed again (not parsed again) when it changes
+        self.transliterate = self.settings.get_bool("transliterate", "main", False)
+        self.store_kind = (self.settings.get_stripped("store", "main", "memory") or "memory").lower()
+        if self.store_kind not in ("memory", "sqlite"):
+            self.warn(f"Unknown store '{self.store_kind}', keeping the contacts in memory")
+        if self.settings.get_bool("stats", "main", False):
+            if self.stats is None:
+                self.stats = Stats()
+                self.stats.instrument(self, self.STATS_METHODS)
+        elif self.stats is not None:
+            Stats.uninstrument(self, self.STATS_METHODS)
+            self.stats = None
+        if self.settings.get_bool("hit_history", "main", True):
+            if self.history is None:
+                self.history = HitHistory(os.path.join(kp.user_config_dir(), self.HISTORY_FILE), self.warn)
+                self.history.load()
+        else:
+            self.history = None
 
-        self.vcard_files = self.get_vcf_files()
+        vcard_files = self.get_vcf_files()
         
         # Install a demo vCard file if non is configured (will be ignored once configured)
-        if len(self.vcard_files) == 0:
+        if len(vcard_files) == 0:
             sample_vcf_path = os.path.join(kp.user_config_dir(), self.SAMPLE_VCF)
             if not os.path.exists(sample_vcf_path):
                 sample_vcf_text = self.load_text_resource(self.PACKAGED_SAMPLE_VCF).replace("\r\n","\n")
                 with open(sample_vcf_path, "w") as f:
                     f.write(sample_vcf_text)
                     f.close()
-            self.load_vcard_file(sample_vcf_path)
-            return
+            vcard_files = [VcfFile(self.SAMPLE_VCF)]
+
+        # Keep the source refresh schedule of files whose source did not change
+        previous_files = { vcard_file.filename: vcard_file for vcard_file in self.vcard_files }
+        for vcard_file in vcard_files:
+            previous = previous_files.get(vcard_file.filename)
+            if previous and (previous.source, previous.reload_delta) == (vcard_file.source, vcard_file.reload_delta):
+                vcard_file.next_reload = previous.next_reload
+            if previous and previous.source == vcard_file.source:
+                vcard_file.transfers = previous.transfers
+        self.vcard_files = vcard_files
+
+        self.start_loading()
+
+    def start_loading(self):
+        """ Loads the contacts in a background worker. If asked while loading,
+        the worker runs once more to pick up the latest settings """
+        with self.load_lock:
+            if self.loader:
+                self.load_requested = True
+                return
+            self.loader = threading.Thread(target=self.loader_main, name="PplLoader", daemon=True)
+            self.loader.start()
+
+    def loader_main(self):
+        while True:
+            vcard_files = self.vcard_files
+            self.info(f"Loading contacts of {len(vcard_files)} file(s)")
+            start = time.perf_counter()
+            try:
+                # Serve the local (or cached) copies first, then sync due sources
+                self.load_contacts(vcard_files)
+                if self.sync_sources(vcard_files):
+                    self.load_contacts(vcard_files)
+                self.info(f"Contacts ready, {self.contact_set.size()} contacts loaded in {time.perf_counter() - start:.2f}s")
+            except Exception as exc:
+                self.err(f"Failed to load contacts, {exc}")
+            self.dump_stats()
+
+            with self.load_lock:
+                if not self.load_requested:
+                    self.loader = None
+                    return
+                self.load_requested = False
 
-        for vcard_file in self.vcard_files:
+    def sync_sources(self, vcard_files):
+        """ Copies due remote sources, returns True if any was copied """
+        copied = False
+        for vcard_file in vcard_files:
             vcard_file_path = os.path.join(kp.user_config_dir(), vcard_file.filename)
+            transfers = vcard_file.transfers
+            try:
+                if vcard_file.sync_source(vcard_file_path):
+                    self.info(f"Copied {vcard_file.source} to {vcard_file_path}, {transfers['last_bytes'] / 1024:.0f} KB "
+                        f"in {transfers['last_seconds']:.2f}s")
+                    copied = True
+            except Exception as exc:
+                self.err(f"Failed to copy {vcard_file.source} to {vcard_file_path}, {exc}")
+            if self.stats and vcard_file.source:
+                self.stats.sources[vcard_file.source] = dict(transfers)
+        return copied
+
+    def warn_skipped(self, vcard_file, vcard_file_path):
+        """ Logs the records of a table file which are not contacts """
+        skipped = vcard_file.skipped if isinstance(vcard_file, TableFile) else None
+        if skipped:
+            lines = ", ".join(map(str, skipped[:10])) + (", ..." if len(skipped) > 10 else "")
+            self.warn(f"Skipped {len(skipped)} record(s) of {vcard_file_path} which are not contacts with a name, "
+                f"line(s) {lines}")
+
+    def load_error(self, vcard_file_path, exc):
+        self.err(f"Failed to load contacts file {vcard_file_path}, {exc}")
+        if isinstance(exc, LookupError):
+            self.err(f"Available encodings are: \n{set(aliases.keys())}")
+
+    def parse_vcard_files(self, jobs):
+        """ Parses the (vcard_file, path, fingerprint) jobs one after the
+        other, in the loader thread: parsing holds the GIL, so worker threads
+        would only slow it down, and worker processes cannot be started
+        inside Keypirinha, whose executable is not a Python interpreter.
+        Yields each job with its contacts, or the exception that failed it """
+        for job in jobs:
+            vcard_file, vcard_file_path, _ = job
             if vcard_file.custom_tag:
                 self.info(f"Loading {vcard_file.filename} with custom VCARD tags")
+            self.info(f"Loading contacts file {vcard_file_path}")
+            try:
+                yield job, parse_vcard_range(vcard_file_path, vcard_file)
+            except Exception as exc:
+                yield job, exc
+
+    def load_contacts(self, vcard_files):
+        """ Loads the given files incrementally: a file is parsed again only if
+        its fingerprint changed since it was loaded and it is not cached. The
+        contacts loaded so far are served while the remaining files load. The
+        journal of a file loads after it, as a small file of its own, so that
+        the file itself stays loaded when only its journal changes """
+        store = self.open_store() if self.store_kind == "sqlite" else None
+        if store is not None:
+            return self.load_store(store, vcard_files)
+        self.store = None
+
+        previous_files = self.contact_set.files
+        loaded_files = {}
+        jobs = []
+        vcard_files = self.with_journals(vcard_files)
+
+        def ordered(fallback_files):
+            return { vcard_file.filename: loaded_files.get(vcard_file.filename, fallback_files.get(vcard_file.filename))
+                for vcard_file in vcard_files
+                if vcard_file.filename in loaded_files or vcard_file.filename in fallback_files }
+
+        for vcard_file in vcard_files:
+            vcard_file_path = os.path.join(kp.user_config_dir(), vcard_file.filename)
             try:
-                if vcard_file.source and os.path.exists(vcard_file.source):
-                    copyfile(vcard_file.source, vcard_file_path)
-                if not os.path.exists(vcard_file_path):
-                    if vcard_file.source != None:
-                        self.err(f"Failed to load vCard file '{vcard_file_path}'. File does not exist and cannot be copied from {vcard_file.source}")
-                    else:
-                        self.err(f"Failed to load vCard file '{vcard_file_path}'. File does not exist")
+                if not self.local_file_exists(vcard_file, vcard_file_path):
+                    continue
+
+                previous = previous_files.get(vcard_file.filename)
+                fingerprint = vcard_file.fingerprint(vcard_file_path, previous[0] if previous else None)
+                if previous and VcfFile.same_content(previous[0], fingerprint):
+                    contacts, index = previous[1:]
+                    if index.transliterate != self.transliterate:
+                        index = self.build_index(contacts)
+                    loaded_files[vcard_file.filename] = (fingerprint, contacts, index)
                     continue
-                self.load_vcard_file(vcard_file_path, vcard_file)
-            except LookupError as exc:
-                self.err(f"Failed to load vCard (.vcf) file {vcard_file_path}, {exc}")                
-                self.err(f"Available encodings are: \n{set(aliases.keys())}")
+
+                # Parsed contacts are cached per file fingerprint
+                cached = self.load_cache(fingerprint) if self.cache_contacts else None
+                if cached:
+                    contacts, index = cached
+                    self.info(f"Loaded {len(contacts)} contacts of {vcard_file_path} from cache")
+                    if index.transliterate != self.transliterate:
+                        index = self.build_index(contacts)
+                        self.save_cache(fingerprint, contacts, index)
+                    loaded_files[vcard_file.filename] = (fingerprint, contacts, index)
+                else:
+                    jobs.append((vcard_file, vcard_file_path, fingerprint))
             except Exception as exc:
-                self.err(f"Failed to load vCard (.vcf) file {vcard_file_path}, {exc}")
-    
+                self.load_error(vcard_file_path, exc)
+
+        if jobs:
+            self.contact_set = ContactSet(ordered(previous_files), self.contact_set, self.merge_contacts)
+
+        stats = self.stats
+        start = time.perf_counter()
+        for (vcard_file, vcard_file_path, fingerprint), contacts in self.parse_vcard_files(jobs):
+            if isinstance(contacts, Exception):
+                self.load_error(vcard_file_path, contacts)
+                continue
+            self.warn_skipped(vcard_file, vcard_file_path)
+            assign_contact_ids(vcard_file.journal_of or vcard_file.filename, contacts)
+            index = self.build_index(contacts)
+            if vcard_file.lazy:
+                contacts = self.card_refs(vcard_file, vcard_file_path, fingerprint, contacts)
+            if self.cache_contacts:
+                self.save_cache(fingerprint, contacts, index)
+            if stats:
+                # Files complete in turn, a file's time is since the previous one
+                stats.record("load_vcard_file", time.perf_counter() - start)
+                start = time.perf_counter()
+            loaded_files[vcard_file.filename] = (fingerprint, contacts, index)
+            self.contact_set = ContactSet(ordered(previous_files), self.contact_set, self.merge_contacts)
+
+        loaded_files = ordered({})
+        if list(loaded_files.values()) != list(previous_files.values()) or self.contact_set.merge != self.merge_contacts:
+            self.contact_set = ContactSet(loaded_files, self.contact_set, self.merge_contacts)
+
+    @staticmethod
+    def with_journals(vcard_files):
+        """ Returns the files with, after each one, its journal if there is one """
+        return [file for vcard_file in vcard_files for file in (vcard_file, vcard_file.journal())
+            if file is vcard_file or os.path.exists(os.path.join(kp.user_config_dir(), file.filename))]
+
+    def local_file_exists(self, vcard_file, vcard_file_path):
+        """ Returns True if the file exists, logs why not otherwise """
+        if os.path.exists(vcard_file_path):
+            return True
+        if vcard_file.source and vcard_file.next_reload is None:
+            pass    # Not copied yet, loaded once the source syncs
+        elif vcard_file.source != None:
+            self.err(f"Failed to load contacts file '{vcard_file_path}'. File does not exist and cannot be copied from {vcard_file.source}")
+        else:
+            self.err(f"Failed to load contacts file '{vcard_file_path}'. File does not exist")
+        return False
+
+    def open_store(self):
+        """ Returns the SQLite store, opened if needed, or None if it cannot
+        be, the contacts being kept in memory then """
+        path = os.path.join(kp.user_config_dir(), self.CACHE_DIR, self.STORE_FILE)
+        store = self.store
+        if store is not None and store.transliterate == self.transliterate:
+            return store
+        if sqlite3 is None:
+            self.err("The sqlite store needs the sqlite3 module, keeping the contacts in memory")
+            return None
+        try:
+            self.store = SqliteStore(path, self.transliterate)
+        except sqlite3.Error as exc:
+            self.err(f"Failed to open the contacts database {path}, {exc}, keeping the contacts in memory")
+            self.store = None
+        return self.store
+
+    def load_store(self, store, vcard_files):
+        """ Ingests into the store the files whose fingerprint changed since
+        they were, one transaction each, and removes the files no longer
+        there. The contacts ingested so far are served while the remaining
+        files are """
+        fingerprints = store.fingerprints()
+        jobs = []
+        local_files = set()
+        for vcard_file in self.with_journals(vcard_files):
+            vcard_file_path = os.path.join(kp.user_config_dir(), vcard_file.filename)
+            try:
+                if not self.local_file_exists(vcard_file, vcard_file_path):
+                    continue
+                local_files.add(vcard_file.filename)
+                previous = fingerprints.get(vcard_file.filename)
+                fingerprint = vcard_file.fingerprint(vcard_file_path, previous)
+                if previous and VcfFile.same_content(previous, fingerprint):
+                    if fingerprint != previous:
+                        store.update_fingerprint(vcard_file.filename, fingerprint)
+                else:
+                    jobs.append((vcard_file, vcard_file_path, fingerprint))
+            except Exception as exc:
+                self.load_error(vcard_file_path, exc)
+
+        removed = [filename for filename in fingerprints if filename not in local_files]
+        if removed:
+            store.remove(removed)
+        if removed or not isinstance(self.contact_set, SqliteContactSet) or self.contact_set.store is not store:
+            self.contact_set = SqliteContactSet(store)
+
+        # Table files are streamed into the store a record at a time, in
+        # bounded memory, vCard files are parsed concurrently
+        parsed = self.parse_vcard_files([job for job in jobs if not isinstance(job[0], TableFile)])
+        streamed = ((job, job[0].iter_contacts(job[1])) for job in jobs if isinstance(job[0], TableFile))
+        stats = self.stats
+        start = time.perf_counter()
+        for (vcard_file, vcard_file_path, fingerprint), contacts in itertools.chain(parsed, streamed):
+            if isinstance(contacts, Exception):
+                self.load_error(vcard_file_path, contacts)
+                continue
+            if isinstance(vcard_file, TableFile):
+                self.info(f"Loading contacts file {vcard_file_path}")
+            try:
+                count = store.ingest(vcard_file.filename, fingerprint,
+                    iter_contact_ids(vcard_file.journal_of or vcard_file.filename, contacts))
+            except sqlite3.Error as exc:
+                self.err(f"Failed to store the contacts of {vcard_file_path}, {exc}")
+                continue
+            except Exception as exc:
+                self.load_error(vcard_file_path, exc)
+                continue
+            self.info(f"Stored {count} contacts of {vcard_file_path}")
+            self.warn_skipped(vcard_file, vcard_file_path)
+            if stats:
+                stats.record("load_vcard_file", time.perf_counter() - start)
+                start = time.perf_counter()
+            self.contact_set = SqliteContactSet(store)
+
     def on_start(self):
         self.settings = self.load_settings()
         self._debug = False
         self.load_contacts_and_settings()
         self.VERBS = { v.name: v for v in self.VERB_LIST}
         self.VERB_CONTACT_FIELDS = { v.contact_field: v for v in self.VERB_LIST}
+        self.PHONE_FIELDS = tuple(v.contact_field for v in self.VERB_LIST if v.contact_field.startswith("TEL;"))
 
     def on_activated(self):
-        pass
+        # Refresh files whose remote source is due
+        if any(vcard_file.reload_due() for vcard_file in self.vcard_files):
+            self.start_loading()
 
     def on_deactivated(self):
         pass
@@ -267,16 +2827,47 @@ class Ppl(kp.Plugin):
                     hit_hint = kp.ItemHitHint.NOARGS)
             for v in self.VERB_LIST
         ]
+        if self.stats:
+            catalog.append(self.create_item(
+                category = self.ITEMCAT_STATS,
+                label = self.ITEM_LABEL_PREFIX + self.STATS_TARGET,
+                short_desc = "Copy Ppl's call counts and latencies to the clipboard",
+                target = self.STATS_TARGET,
+                args_hint = kp.ItemArgsHint.FORBIDDEN,
+                hit_hint = kp.ItemHitHint.IGNORE))
 
         self.set_catalog(catalog)
+
+    def dump_stats(self):
+        """ Writes the stats to the User folder, returns them or None """
+        stats = self.stats
+        if not stats:
+            return None
+        path = os.path.join(kp.user_config_dir(), self.STATS_FILE)
+        try:
+            return stats.dump(path)
+        except OSError as exc:
+            self.warn(f"Failed to write stats {path}, {exc}")
+            return stats.snapshot()
     
+    def item_contact(self, contact_set, params):
+        """ Returns the contact of an item, None if a reload removed it """
+        contact = contact_set.get(params['contact_id'])
+        if contact is None:
+            if contact_set.position(params['contact_id']) is not None:
+                # Lazily loaded from a file changed since, load it again
+                self.start_loading()
+            self.warn(f"Contact {params['contact_id']} is no longer loaded, ignoring the stale item")
+        return contact
+
     def suggest_copy(self, current_item, params):
-        contact_no = int(params['contact_no'])
-        contact = self.contacts[contact_no]
+        contact = self.item_contact(self.contact_set, params)
+        if contact is None:
+            return
         verb = self.COPY_VERB
 
         if self._debug:
-            self.dbg(f"Suggest copy action(s) for contact {contact['name']} - {repr(contact)} \nparams={repr(params)}")
+            self.dbg(f"Suggest copy action(s) for contact {contact.name} - {repr(contact)} \nparams={repr(params)}")
 
         suggestions = []
 
@@ -289,78 +2880,145 @@ class Ppl(kp.Plugin):
             args_hint=kp.ItemArgsHint.FORBIDDEN,
             hit_hint=kp.ItemHitHint.IGNORE,
             loop_on_suggest = False,
-            data_bag=kpu.kwargs_encode(verb_name=verb.name, contact_no=contact_no, action=self.ACTION_COPY)))
+            data_bag=kpu.kwargs_encode(verb_name=verb.name, contact_id=contact.uid, action=self.ACTION_COPY)))
             
         self.set_suggestions(suggestions, kp.Match.ANY, kp.Sort.NONE)
         
     # Suggestions possible actions for current contacts
     def suggest_actions(self, current_item, params):
-        contact_no = int(params['contact_no'])
-        contact = self.contacts[contact_no]
+        contact_set = self.contact_set
+        contact = self.item_contact(contact_set, params)
+        if contact is None:
+            return
 
         if self._debug:
-            self.dbg(f"Suggest actions for contact {contact['name']} - {repr(contact)}")
-
-        suggestions = []
-        # suggestions.insert(0, item)
-        for key in contact.keys():
-            if not key.startswith("TEL;") or not key in self.VERB_CONTACT_FIELDS:
-                continue
+            self.dbg(f"Suggest actions for contact {contact.name} - {repr(contact)}")
 
-            verb = self.VERB_CONTACT_FIELDS[key]
-            if not verb.contact_field in contact:
-                continue
-
-            target = contact[verb.contact_field]
-            title = contact[self.AD_ATTR_TITLE] if self.AD_ATTR_TITLE in contact else ""
-            suggestions.append(self.create_item(
+        suggestions = [self.create_item(
                 category=self.ITEMCAT_ACTION,
-                label=f'Call {contact[self.ID_NAME]} - {target} ({verb.name})',
-                short_desc=title,
-                target=contact[verb.contact_field],
+                label=label,
+                short_desc=short_desc,
+                target=target,
                 args_hint=kp.ItemArgsHint.FORBIDDEN,
                 hit_hint=kp.ItemHitHint.IGNORE,
-                loop_on_suggest = True,
-                data_bag=kpu.kwargs_encode(verb_name=verb.name, contact_no=contact_no, action=verb.action)))
+                loop_on_suggest=loop_on_suggest,
+                data_bag=data_bag)
+            for label, short_desc, target, data_bag, loop_on_suggest in self.action_payloads(contact_set, contact)]
+        self.set_suggestions(suggestions, kp.Match.ANY, kp.Sort.NONE)
 
-        if self.AD_ATTR_MAIL in contact:
+    def action_payloads(self, contact_set, contact):
+        """ Returns the (label, short_desc, target, data_bag, loop_on_suggest)
+        of the actions of a contact, computed once per contact set """
+        payloads = contact_set.action_payloads.get(contact.uid)
+        if payloads is not None:
+            return payloads
+
+        payloads = []
+        title = contact.description
+        for key, number in contact.phones:
+            if not key in self.VERB_CONTACT_FIELDS:
+                continue
+            verb = self.VERB_CONTACT_FIELDS[key]
+            payloads.append((f'Call {contact.name} - {number} ({verb.name})', title, number,
+                kpu.kwargs_encode(verb_name=verb.name, contact_id=contact.uid, action=verb.action), True))
+
+        if contact.mail:
             verb = self.VERB_CONTACT_FIELDS[self.AD_ATTR_MAIL]
-            target = contact[verb.contact_field]
-            title = contact[self.AD_ATTR_TITLE] if self.AD_ATTR_TITLE in contact else ""
-            suggestions.append(self.create_item(
-                category=self.ITEMCAT_ACTION,
-                label=f'{verb.name} {contact[self.ID_NAME]} - {target}',
-                short_desc=title,
-                target=target,
-                args_hint=kp.ItemArgsHint.FORBIDDEN,
-                hit_hint=kp.ItemHitHint.IGNORE,
-                loop_on_suggest = True,
-                data_bag=kpu.kwargs_encode(verb_name=verb.name, contact_no=contact_no, action=verb.action)))
+            data_bag = kpu.kwargs_encode(verb_name=verb.name, contact_id=contact.uid, action=verb.action)
+            for target in (contact.mail,) + contact.alt_mails:
+                payloads.append((f'{verb.name} {contact.name} - {target}', title, target, data_bag, True))
 
         verb = self.VERB_CONTACT_FIELDS[self.AD_ATTR_NAME]
-        target = contact[verb.contact_field]
-        title = contact[self.AD_ATTR_TITLE] if self.AD_ATTR_TITLE in contact else ""
-        suggestions.append(self.create_item(
-            category=self.ITEMCAT_ACTION,
-            label=f'{verb.name} {contact[self.ID_NAME]} - {target}',
-            short_desc=title,
-            target=target,
-            args_hint=kp.ItemArgsHint.FORBIDDEN,
-            hit_hint=kp.ItemHitHint.IGNORE,
-            loop_on_suggest = True,
-            data_bag=kpu.kwargs_encode(verb_name=verb.name, contact_no=contact_no, action=verb.action)))
+        target = contact.get(verb.contact_field)
+        data_bag = kpu.kwargs_encode(verb_name=verb.name, contact_id=contact.uid, action=verb.action)
+        payloads.append((f'{verb.name} {contact.name} - {target}', title, target, data_bag, True))
+        payloads.append((f'{verb.name} {contact.name} - {target}', title, target, data_bag, False))
 
-        suggestions.append(self.create_item(
-            category=self.ITEMCAT_ACTION,
-            label=f'{verb.name} {contact[self.ID_NAME]} - {target}',
-            short_desc=title,
-            target=target,
-            args_hint=kp.ItemArgsHint.FORBIDDEN,
-            hit_hint=kp.ItemHitHint.IGNORE,
-            loop_on_suggest = False,
-            data_bag=kpu.kwargs_encode(verb_name=verb.name, contact_no=contact_no, action=verb.action)))
+        contact_set.action_payloads[contact.uid] = payloads
+        return payloads
 
-        self.set_suggestions(suggestions, kp.Match.ANY, kp.Sort.NONE)
+    def target_fields(self, verb):
+        """ Returns the contact fields a verb may act on, first ones first """
+        if verb.contact_field == self.AD_ATTR_PHONE:
+            return self.PHONE_FIELDS
+        return (verb.contact_field,)
+
+    def verb_field(self, verb, contact):
+        """ Returns the contact field a verb acts on, None if the contact has
+        no such field """
+        for field in self.target_fields(verb):
+            if contact.has(field):
+                return field
+        return None
+
+    def contact_payload(self, contact_set, verb, idx):
+        """ Returns the (label, short_desc, target, data_bag) of the item of a
+        contact (numbered in contact_set) for a verb, None if the contact has
+        no target for the verb. Computed once per contact set """
+        payloads = contact_set.payloads.setdefault(verb.name, {})
+        if idx in payloads:
+            return payloads[idx]
+
+        contact = contact_set.contact(idx)
+        if contact is None:
+            # Lazily loaded from a file changed since, load it again
+            self.start_loading()
+            return None
+        field = self.verb_field(verb, contact)
+        payload = None
+        if field is not None:
+            target = contact.get(field)
+            if field.startswith("TEL;"):
+                label = f'Call {contact.name} ({verb.name}) - {target}'
+            else:
+                label = f'{verb.name} {contact.name} - {target}'
+            payload = (label, contact.description, target,
+                kpu.kwargs_encode(verb_name=verb.name, contact_id=contact.uid, action=verb.action))
+        payloads[idx] = payload
+        return payload
+
+    def boost_favorites(self, contact_set, verb, query, matches):
+        """ Puts the contacts most used with the verb that match the query well
+        (up to initials) ahead of the other matches (numbers in contact_set),
+        by frecency """
+        favorites = self.history.favorites(verb.name) if self.history else None
+        if not favorites or not query:
+            return matches
+        boosted = []
+        for uid, score in favorites.items():
+            idx = contact_set.position(uid)
+            if idx is None:
+                continue
+            rank = contact_set.index.rank(query, idx)
+            if rank is not None and rank <= ContactIndex.RANK_INITIALS and \
+                    self.verb_field(verb, contact_set.contacts[idx]) is not None:
+                boosted.append((-score, rank, idx))
+        if not boosted:
+            return matches
+        boosted = list(dict.fromkeys(idx for _, _, idx in sorted(boosted)))
+        return (boosted + [idx for idx in matches if idx not in boosted])[:self.MAX_SUGGESTIONS]
+
+    def find_contacts(self, contact_set, verb, query):
+        """ Returns the numbers of the best contacts matching the (normalized)
+        query that have a target for the verb """
+        contacts = contact_set.contacts
+        query_cache = contact_set.query_cache(verb.name)
+        candidates = query_cache.candidates(query)
+        hidden = contact_set.hidden
+        stats = self.stats
+        if stats:
+            start = time.perf_counter()
+        matches, matched = contact_set.index.search(query, self.MAX_SUGGESTIONS,
+            lambda idx: idx not in hidden and self.verb_field(verb, contacts[idx]) is not None,
+            candidates, self.field_weights, self.target_fields(verb))
+        if stats:
+            # The searches narrowing the cached matches of a shorter query
+            # apart from the others, to tell what the query cache saves
+            stats.record("search_narrowed" if candidates is not None else "search_full", time.perf_counter() - start)
+            stats.count("query_cache_hits" if candidates is not None else "query_cache_misses")
+        if matched is not None:
+            query_cache.add(query, matched)
+        return self.boost_favorites(contact_set, verb, query, contact_set.canonical(matches))
 
     # Suggestions matching contacts with a default action
     def suggest_contacts(self, current_item, params, user_input):
@@ -368,46 +3026,24 @@ class Ppl(kp.Plugin):
         if self._debug:
             self.dbg(f"Suggest contacts matching '{user_input}' for {verb.name}")
 
-        # Creating list of "{verb} {name} - {associated-item}"
+        # Creating list of "{verb} {name} - {associated-item}" for the best matches
         suggestions = []
-        for idx,contact in enumerate(self.contacts):
-            if len(suggestions) > 10:
-                break
-                
-            if (not (self.ID_NAME in contact) or not contact[self.ID_NAME]):
-                continue
-            
-            if not user_input.lower() in contact[self.ID_NAME].lower():
-                continue
-
-            item_target = None
-            if (verb.contact_field.startswith("TEL;") and verb.contact_field in contact):
-                item_target = contact[verb.contact_field]
-                item_label = f'Call {contact[self.ID_NAME]} ({verb.name}) - {item_target}'
-            elif (verb.contact_field == self.AD_ATTR_PHONE):
-                for v in self.VERB_LIST:
-                    if v.contact_field.startswith("TEL;") and v.contact_field in contact:
-                        item_target = contact[v.contact_field]
-                        item_label = f'Call {contact[self.ID_NAME]} ({verb.name}) - {item_target}'
-                        break
-                if not item_target:
-                    continue
-            elif verb.contact_field in contact:
-                item_target = contact[verb.contact_field]
-                item_label = f'{verb.name} {contact[self.ID_NAME]} - {item_target}'
-            else:
-                continue
-
-            title = contact[self.AD_ATTR_TITLE] if self.AD_ATTR_TITLE in contact else ""
+        contact_set = self.contact_set
+        matches = self.find_contacts(contact_set, verb, SegmentedIndex.normalize(user_input, self.transliterate))
+        for idx in matches:
+            payload = self.contact_payload(contact_set, verb, idx)
+            if payload is None:
+                continue    # Its file changed since it was loaded
+            label, short_desc, target, data_bag = payload
             suggestions.append(self.create_item(
                 category=self.ITEMCAT_CONTACT,
-                label=item_label,
-                short_desc=title,
-                target=item_target,
+                label=label,
+                short_desc=short_desc,
+                target=target,
                 args_hint=kp.ItemArgsHint.ACCEPTED,
                 hit_hint=kp.ItemHitHint.IGNORE,
                 loop_on_suggest = True,
-                data_bag=kpu.kwargs_encode(verb_name=verb.name, contact_no=idx, action=verb.action)))
+                data_bag=data_bag))
 
         self.set_suggestions(suggestions, kp.Match.ANY, kp.Sort.NONE)
 
@@ -429,15 +3065,24 @@ class Ppl(kp.Plugin):
                 self.dbg(f"on_suggest ignored")
         
     def do_card_action(self, contact):
-        text = f"Name\t{contact[self.AD_ATTR_NAME]}"
+        text = f"Name\t{contact.name}"
         
-        if contact[self.AD_ATTR_MAIL]:
-            text += f"\nMail\t{contact[self.AD_ATTR_MAIL]}"
+        for mail in (contact.mail,) + contact.alt_mails:
+            if mail:
+                text += f"\nMail\t{mail}"
         for v in self.VERB_LIST:
-            if v.contact_field.startswith("TEL;") and v.contact_field in contact:
-                text += f"\n{v.name}#\t{contact[v.contact_field]}"
-        if contact[self.AD_ATTR_TITLE]:
-            text += f"\nTitle\t{contact[self.AD_ATTR_TITLE]}"
+            if v.contact_field.startswith("TEL;") and contact.has(v.contact_field):
+                text += f"\n{v.name}#\t{contact.get(v.contact_field)}"
+        if contact.sources:
+            # Merged contacts may have more than one phone of a kind
+            shown = {v.contact_field for v in self.VERB_LIST}
+            for field, number in contact.phones:
+                if field in self.VERB_CONTACT_FIELDS and number != contact.get(field) and field in shown:
+                    text += f"\n{self.VERB_CONTACT_FIELDS[field].name}#\t{number}"
+        if contact.description:
+            text += f"\nTitle\t{contact.description}"
+        if contact.sources:
+            text += f"\nSources\t{', '.join(contact.sources)}"
 
         kpu.set_clipboard(text)
 
@@ -446,27 +3091,39 @@ class Ppl(kp.Plugin):
         kpu.shell_execute(url, args='', working_dir='', verb='', try_runas=True, detect_nongui=True, api_flags=None, terminal_cmd=None, show=-1)
         
     def do_call_action(self, contact, verb, protocol):
-        url = protocol.replace("%s", contact[verb.contact_field].replace(" ", ""))
+        url = protocol.replace("%s", contact.get(verb.contact_field).replace(" ", ""))
         kpu.shell_execute(url, args='', working_dir='', verb='', try_runas=True, detect_nongui=True, api_flags=None, terminal_cmd=None, show=-1)
     
-    def do_mail_action(self, contact, verb, protocol):
-        url = protocol.replace("%s", contact[verb.contact_field].replace(" ", ""))
+    def do_mail_action(self, contact, verb, protocol, selection=None):
+        # A merged contact may be mailed at any of its emails
+        mail = selection if selection in contact.alt_mails else contact.get(verb.contact_field)
+        url = protocol.replace("%s", mail.replace(" ", ""))
         kpu.shell_execute(url, args='', working_dir='', verb='', try_runas=True, detect_nongui=True, api_flags=None, terminal_cmd=None, show=-1)
     
     def on_execute(self, item, action):
         if (not item):
             return 
             
+        if item.category() == self.ITEMCAT_STATS:
+            snapshot = self.dump_stats()
+            if snapshot:
+                kpu.set_clipboard(self.stats.summary(snapshot))
+            return
+
         selection = item.target()
         params = kpu.kwargs_decode(item.data_bag())
         verb_name = params['verb_name']
-        contact_no = int(params['contact_no'])
-        contact = self.contacts[contact_no]
+        contact = self.item_contact(self.contact_set, params)
+        if contact is None:
+            return
         verb = self.VERBS[verb_name]
 
         if self._debug:
             self.dbg(f"Executing {verb_name}: {selection}, defaultAction: {item.category() == self.ITEMCAT_CONTACT}\n")
 
+        if self.history:
+            self.history.record(verb_name, contact.uid)
+
         if verb.action == self.ACTION_CELL:
             self.do_cell_action(contact, selection, self.cell_protocol)
         elif verb.action == self.ACTION_CALL:
@@ -474,7 +3131,7 @@ class Ppl(kp.Plugin):
         elif verb.action == self.ACTION_CHAT:
             self.do_call_action(contact, verb, self.chat_protocol)
         elif verb.action == self.ACTION_MAIL:
-            self.do_mail_action(contact, verb, self.mail_protocol)
+            self.do_mail_action(contact, verb, self.mail_protocol, selection)
         elif verb.action == self.ACTION_CARD:
             self.do_card_action(contact)
         else: